@@ -0,0 +1,116 @@
+"""
+Server-wide memory budget and per-connection stream caps.
+
+Every byte a receiving stream holds in memory (0-RTT data waiting for the
+handshake, write batches, writes queued on the disk executor) is charged
+to one MemoryBudget shared by all connections of the process. A
+connection's MAX_DATA is only raised by as much as the budget has left,
+and while the budget is exhausted streams stop getting MAX_STREAM_DATA
+credit too, so senders stall at their current windows instead of the
+server buffering more. Credit flows again once usage falls below
+RESUME_FRACTION of the budget. Credit already granted (at least the
+profile's initial windows) cannot be taken back, so usage can overshoot
+the budget by up to that much per connection.
+
+aioquic raises MAX_STREAMS whenever half the streams are used, so a peer
+can keep any number of streams open. GatedLimit caps such a limit
+instead: the peer is allowed its finished streams plus the cap, which
+bounds how many it has open at once.
+"""
+import os
+from aioquic.quic.connection import Limit
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024  # Bytes, when MEMORY_BUDGET_MB is not set
+RESUME_FRACTION = 0.75  # Credit is granted again below this share of the budget
+
+
+def memory_budget_bytes():
+    """MEMORY_BUDGET_MB from .env (see load_env_vars) in bytes"""
+    value = os.getenv("MEMORY_BUDGET_MB", "")
+    try:
+        return int(float(value) * 1024 * 1024) if value else DEFAULT_MEMORY_BUDGET
+    except ValueError:
+        raise ValueError(f"Invalid MEMORY_BUDGET_MB {value!r}")
+
+
+class MemoryBudget:
+    """Byte count shared by all connections, with callbacks for when it frees up"""
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.exhaustions = 0
+        self.exhausted = False
+        self._waiters = []
+
+    def charge(self, size):
+        self.used += size
+        if self.used > self.peak:
+            self.peak = self.used
+        if not self.exhausted and self.used >= self.limit:
+            self.exhausted = True
+            self.exhaustions += 1
+            print(f"[!] Memory budget exhausted ({self.used >> 20} of {self.limit >> 20} MB buffered); "
+                  f"withholding flow-control credit")
+
+    def release(self, size):
+        self.used -= size
+        if self.exhausted and self.used < self.limit * RESUME_FRACTION:
+            self.exhausted = False
+            print(f"[+] Memory budget recovered ({self.used >> 20} MB buffered)")
+            waiters, self._waiters = self._waiters, []
+            for callback in waiters:
+                callback()
+
+    def when_available(self, callback):
+        """Call callback (once) when the budget stops being exhausted"""
+        if callback not in self._waiters:
+            self._waiters.append(callback)
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "used": self.used,
+            "peak": self.peak,
+            "exhausted": self.exhausted,
+            "exhaustions": self.exhaustions,
+        }
+
+
+class GatedLimit(Limit):
+    """
+    Replacement for an aioquic connection Limit whose increases are capped
+    by gate() (None for no cap). It never decreases, since a MAX_DATA or
+    MAX_STREAMS value already sent cannot be taken back.
+    """
+    def __init__(self, limit, gate):
+        self.frame_type = limit.frame_type
+        self.name = limit.name
+        self.sent = limit.sent
+        self.used = limit.used
+        self._value = limit.value
+        self.gate = gate
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        ceiling = self.gate()
+        if ceiling is not None:
+            value = min(value, max(ceiling, self._value))
+        self._value = value
+
+
+def gate_connection(quic, budget, stream_cap):
+    """
+    Raise a server connection's MAX_DATA by no more than budget has left
+    and keep at most stream_cap peer-opened streams unfinished. The server
+    opens no streams of its own, so every finished stream was the peer's.
+    """
+    quic._local_max_data = GatedLimit(
+        quic._local_max_data,
+        lambda: quic._local_max_data.used + max(0, budget.limit - budget.used) if not budget.exhausted else 0)
+    quic._local_max_streams_bidi = GatedLimit(quic._local_max_streams_bidi,
+                                              lambda: len(quic._streams_finished) + stream_cap)
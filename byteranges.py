@@ -0,0 +1,64 @@
+"""
+Helpers for sorted, non-overlapping [start, stop) byte range lists.
+Used to track which parts of a file have arrived when it is written
+out of order.
+"""
+
+
+def add_range(ranges, start, stop):
+    """Insert [start, stop) into a sorted range list, merging neighbours. Returns the new list."""
+    if stop <= start:
+        return ranges
+
+    merged = []
+    for r_start, r_stop in ranges:
+        if r_stop < start or r_start > stop:
+            merged.append((r_start, r_stop))
+        else:
+            start = min(start, r_start)
+            stop = max(stop, r_stop)
+    merged.append((start, stop))
+    merged.sort()
+    return merged
+
+
+def remove_range(ranges, start, stop):
+    """Cut [start, stop) out of a sorted range list. Returns the new list."""
+    if stop <= start:
+        return ranges
+
+    remaining = []
+    for r_start, r_stop in ranges:
+        if r_stop <= start or r_start >= stop:
+            remaining.append((r_start, r_stop))
+            continue
+        if r_start < start:
+            remaining.append((r_start, start))
+        if r_stop > stop:
+            remaining.append((stop, r_stop))
+    return remaining
+
+
+def covers(ranges, start, stop):
+    """Whether [start, stop) lies entirely within one range of a merged range list"""
+    return any(r_start <= start and stop <= r_stop for r_start, r_stop in ranges)
+
+
+def missing_ranges(ranges, size):
+    """Return the gaps in [0, size) not covered by ranges"""
+    missing = []
+    position = 0
+    for start, stop in ranges:
+        if start > position:
+            missing.append((position, min(start, size)))
+        position = max(position, stop)
+        if position >= size:
+            break
+    if position < size:
+        missing.append((position, size))
+    return missing
+
+
+def split_range(start, stop, size):
+    """Split [start, stop) into consecutive pieces of at most size bytes"""
+    return [(offset, min(offset + size, stop)) for offset in range(start, stop, size)]
@@ -3,8 +3,29 @@ from flask import Flask, request, jsonify
 import asyncio
 import os
 import json
-from aioquic.asyncio import connect
-from aioquic.quic.configuration import QuicConfiguration
+import hashlib
+import mmap
+import stat
+import time
+import uuid
+import zlib
+import collections
+import itertools
+from contextlib import contextmanager
+from aioquic.asyncio.protocol import QuicConnectionProtocol
+from aioquic.quic.events import ConnectionTerminated, StreamDataReceived, StreamReset
+from flowcontrol import BackpressureMixin
+from connection_pool import ConnectionPool, run_quic
+from byteranges import missing_ranges, split_range
+from delta import compute_delta
+from compression import CODECS, ChunkCompressor, available_codecs
+from framing import INTERACTIVE_COMMANDS, VERSION as FRAME_VERSION, encode_header
+from profiles import apply_connection_limits, quic_configuration
+from integrity import choose_hash, new_hasher
+from manifest import MANIFEST_THRESHOLD, file_manifest
+from hashcache import cached_digest, default_cache
+from packing import PACK_BYTES, PACK_ENTRIES, entry_header, pack_threshold
+from treewalk import WALK_BATCH, mkdir_batches, walk_tree
 import requests
 from startsetup import *
 from scanner import *
@@ -19,104 +40,843 @@ CHUNK_SIZE = 64 * 1024  # 64KB
 ENV_FILE = ".env"
 CORS(app, resources={r"/*": {"origins":"*"}})
 
-async def send_quic_command(host, port, cert_verify, command, src="", dest="", filedata=b""):
+RESPONSE_TIMEOUT = 30.0  # Seconds to wait for the server's response after sending
+VERIFY_RATE = 50 * 1024 * 1024  # Bytes/s a slow server disk rereads at; extends the wait for whole-file checks
+STRIPE_THRESHOLD = 64 * 1024 * 1024  # Files at least this large are striped by default
+RESUME_THRESHOLD = 16 * 1024 * 1024  # Files at least this large are sent resumably
+DEFAULT_STRIPES = 4
+DEFAULT_RANGE_SIZE = 8 * 1024 * 1024
+RANGE_RETRIES = 3
+RESPONSE_LIMIT = 64 * 1024  # Max size of a response line
+SIGNATURE_LIMIT = 8 * 1024 * 1024  # Largest block signature accepted from the server
+TRANSFER_RETRIES = 3  # Attempts per file before a transfer is reported as failed
+RETRY_DELAY = 1.0  # Seconds between attempts
+BATCH_CONCURRENCY = 4  # Files of a /transfer_batch request sent at once
+TREE_CONCURRENCY = 8  # Files of a directory transfer sent at once
+TREE_ERRORS_KEPT = 100  # Failed files listed in a directory transfer's result
+
+
+class TransferError(Exception):
+    """
+    A command the server did not complete.
+    retryable is False when the server rejected the command itself (bad path,
+    permission denied...), since sending it again would fail the same way.
+    """
+    def __init__(self, message, retryable=True, response=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.response = response
+
+
+class TransferClientProtocol(BackpressureMixin, QuicConnectionProtocol):
+    """
+    Client connection that paces sends on aioquic's flow-control state and
+    collects the server's response line on each request stream
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        apply_connection_limits(self._quic)
+        self._responses = {}
+        self._response_buffers = {}
+        self._body_limits = {}
+        self._features = None
+
+    # (server name, port) -> last hello response, reused by resumed sessions
+    _known_features = {}
+
+    async def peer_features(self):
+        """
+        What the server supports (frame_versions, codecs), asked once per
+        connection with a JSON hello. Servers older than hello get {}.
+        A connection resuming a TLS session talks to the server process
+        that issued the ticket, so its earlier answer is reused and the
+        first command is not held up by a hello round trip.
+        """
+        if self._features is None:
+            known = self._known_features.get(self._peer_key())
+            if known is not None and self._quic.configuration.session_ticket is not None:
+                self._features = self._loop.create_future()
+                self._features.set_result(known)
+            else:
+                self._features = self._loop.create_task(self._hello())
+        try:
+            return await asyncio.shield(self._features)
+        except Exception:
+            self._features = None
+            raise
+
+    async def _hello(self):
+        stream_id = self._quic.get_next_available_stream_id(is_unidirectional=False)
+        self.prioritize(stream_id)
+        response = self.expect_response(stream_id)
+        self._quic.send_stream_data(stream_id, json.dumps({"command": "hello"}).encode() + b"\n", end_stream=True)
+        self.transmit()
+        result = await asyncio.wait_for(response, RESPONSE_TIMEOUT)
+        if result.get("status") != "success":
+            return {}
+        print(f"[QUIC] Server supports frame versions {result.get('frame_versions')}, "
+              f"compression {result.get('codecs')}")
+        profile = getattr(self._quic.configuration, "profile", None)
+        if result.get("profile") and result["profile"] != profile:
+            print(f"[!] Server uses transport profile {result['profile']!r}, this client {profile!r}; "
+                  f"set the same QUIC_PROFILE on both for consistent limits")
+        self._known_features[self._peer_key()] = result
+        return result
+
+    def _peer_key(self):
+        paths = self._quic._network_paths
+        return self._quic.configuration.server_name, paths[0].addr[1] if paths else None
+
+    def expect_response(self, stream_id, body_limit=0):
+        """
+        Return a future resolved with the parsed response sent on stream_id.
+        With body_limit, up to that many bytes following the response line
+        are returned in the response's "body" field.
+        """
+        waiter = self._loop.create_future()
+        self._responses[stream_id] = waiter
+        self._response_buffers[stream_id] = bytearray()
+        self._body_limits[stream_id] = body_limit
+        return waiter
+
+    def quic_event_received(self, event):
+        if isinstance(event, StreamDataReceived):
+            waiter = self._responses.get(event.stream_id)
+            if waiter is None:
+                return
+            buffer = self._response_buffers[event.stream_id]
+            buffer.extend(event.data)
+
+            if len(buffer) > RESPONSE_LIMIT + self._body_limits[event.stream_id]:
+                self._resolve_response(event.stream_id, TransferError("Oversized response from server"))
+            elif event.end_stream:
+                line, _, body = bytes(buffer).partition(b"\n")
+                try:
+                    result = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    self._resolve_response(event.stream_id, TransferError(f"Malformed response from server: {line[:200]!r}"))
+                    return
+                if self._body_limits[event.stream_id]:
+                    result["body"] = body
+                self._resolve_response(event.stream_id, result)
+
+        elif isinstance(event, StreamReset):
+            self._resolve_response(event.stream_id, TransferError(f"Stream reset by server (code {event.error_code})"))
+
+        elif isinstance(event, ConnectionTerminated):
+            for stream_id in list(self._responses):
+                self._resolve_response(stream_id, ConnectionError(f"Connection closed: {event.reason_phrase}"))
+
+    def _resolve_response(self, stream_id, result):
+        waiter = self._responses.pop(stream_id, None)
+        self._response_buffers.pop(stream_id, None)
+        self._body_limits.pop(stream_id, None)
+        if waiter is None or waiter.done():
+            return
+        if isinstance(result, BaseException):
+            waiter.set_exception(result)
+        else:
+            waiter.set_result(result)
+
+
+quic_pool = ConnectionPool(create_protocol=TransferClientProtocol)
+
+
+async def send_quic_command(host, port, cert_verify, command, src="", dest="", filedata=b"",
+                            header_fields=None, lane=0, body_parts=None, response_body_limit=0,
+                            compression=None, manifest=None):
     """
-    Send a command to remote QUIC server with improved reliability
-    - command: "copy", "move", "create", "delete"
+    Send a command to remote QUIC server on a new stream of a pooled connection.
+    Must run on the background QUIC loop (see connection_pool.run_quic).
+    - command: "copy", "move", "create", "delete", "stripe_begin", "range", "stripe_commit"
     - src: source path (for delete/create operations)
     - dest: destination path (for copy/move operations)
-    - filedata: file contents (for copy/move operations)
+    - filedata: file contents (for copy/move operations); any buffer, e.g. a
+      memoryview over an mmap, is sliced without copying
+    - header_fields: extra header fields for the command (e.g. transfer_id, offset)
+    - lane: which pooled connection to the peer to use
+    - body_parts: buffers sent back to back as the stream body instead of
+      filedata (e.g. delta instructions)
+    - response_body_limit: accept a response body of up to this many bytes
+      (returned as result["body"])
+    - compression: "auto" or a codec name to send the body as compressed
+      blocks, if the server can decode them
+    - manifest: chunk manifest of the file (see manifest.py) for the server
+      to check the copy or stripe_commit against
     """
-    config = QuicConfiguration(is_client=True, verify_mode=0)
+    if body_parts is None:
+        body_parts = [filedata]
+    body_parts = [part if isinstance(part, memoryview) else memoryview(part) for part in body_parts]
+    total_size = sum(len(part) for part in body_parts)
+    config = quic_configuration(is_client=True, verify_mode=0)
     if cert_verify:
         config.load_verify_locations(cert_verify)
 
     try:
-        async with connect(host, port, configuration=config) as client:
-            print(f"[QUIC] Connected to {host}:{port}, config: {config}, client: {client}")
+        async with quic_pool.connection(host, port, config, lane=lane) as client:
+            print(f"[QUIC] Using connection to {host}:{port}: {client}")
+            features = await client.peer_features()
+            codec = _pick_codec(compression, features.get("codecs", [])) if total_size else None
+            digest = choose_hash(features.get("hashes", [])) if total_size else None
+            hasher = new_hasher(digest) if digest else None
             stream_id = client._quic.get_next_available_stream_id(is_unidirectional=False)
+            # Metadata commands overtake bulk data already queued on the connection
+            if command in INTERACTIVE_COMMANDS:
+                client.prioritize(stream_id)
             
             # Prepare header
-            header = json.dumps({
+            header = {
                 "command": command,
                 "src": src,
                 "dest": dest,
-                "size": len(filedata)  # Add size for verification
-            }).encode()
+                "size": total_size  # Add size for verification
+            }
+            if codec:
+                header["compression"] = codec
+            if digest:
+                header["digest"] = digest
+            if manifest is not None:
+                header["manifest"] = manifest.to_header()
+            header.update(header_fields or {})
+            # Binary frames for servers that understand them, else the JSON line
+            if FRAME_VERSION in features.get("frame_versions", []):
+                header = encode_header(header)
+            else:
+                header = json.dumps(header).encode() + b"\n"
             
             print(f"[QUIC] Sending command: {command}, src: {src}, dest: {dest}")
             
-            # Send header + delimiter
-            client._quic.send_stream_data(stream_id, header + b"\n", end_stream=False)
-            client.transmit()
+            response = client.expect_response(stream_id, body_limit=response_body_limit)
             
-            # Wait for header to be acknowledged
-            await asyncio.sleep(0.1)
+            # Send header; the stream ends here when there is no data
+            client._quic.send_stream_data(stream_id, header, end_stream=not total_size)
+            client.transmit()
             
-            # Send file data if present
-            if filedata:
-                print(f"[QUIC] Sending {len(filedata)} bytes")
-                offset = 0
-                total_size = len(filedata)
+            # Send file data if present, as fast as flow control and
+            # congestion control let the send buffer drain
+            checksum = 0
+            wire_bytes = 0
+            if total_size:
+                print(f"[QUIC] Sending {total_size} bytes")
+                sent = 0
+                next_report = CHUNK_SIZE * 10
                 
-                while offset < total_size:
-                    chunk = filedata[offset:offset + CHUNK_SIZE]
-                    is_last = (offset + len(chunk)) >= total_size
-                    
-                    client._quic.send_stream_data(stream_id, chunk, end_stream=is_last)
+                # FIN rides on the last data frame: aioquic can drop a FIN-only
+                # frame that does not fit in an almost full packet
+                pieces = _body_pieces(body_parts, codec)
+                upcoming = next(pieces, None)
+                while upcoming is not None:
+                    piece, raw = upcoming
+                    upcoming = next(pieces, None)
+                    offset = 0
+                    while offset < len(piece):
+                        # The server answers early only when it rejects the command
+                        if response.done():
+                            break
+                        try:
+                            credit = await client.wait_writable(stream_id, min(CHUNK_SIZE, len(piece) - offset))
+                        except ConnectionError:
+                            if not response.done():
+                                raise
+                            break
+                        chunk = piece[offset:offset + credit]
+                        offset += len(chunk)
+                        wire_bytes += len(chunk)
+                        is_last = upcoming is None and offset >= len(piece) and hasher is None
+                        
+                        client._quic.send_stream_data(stream_id, chunk, end_stream=is_last)
+                        client.transmit()
+                        
+                        # Progress feedback
+                        position = sent + min(offset, len(raw))
+                        if position >= next_report:
+                            next_report += CHUNK_SIZE * 10
+                            progress = (position / total_size) * 100
+                            print(f"[QUIC] Progress: {progress:.1f}% ({position}/{total_size} bytes)")
+                    if response.done():
+                        break
+                    sent += len(raw)
+                    checksum = zlib.crc32(raw, checksum)
+                    if hasher is not None:
+                        hasher.update(raw)
+
+                # The digest trailer follows the data and carries the FIN
+                if hasher is not None and not response.done():
+                    client._quic.send_stream_data(stream_id, hasher.digest(), end_stream=True)
                     client.transmit()
-                    
-                    offset += len(chunk)
-                    
-                    # Progress feedback
-                    if offset % (CHUNK_SIZE * 10) == 0 or is_last:
-                        progress = (offset / total_size) * 100
-                        print(f"[QUIC] Progress: {progress:.1f}% ({offset}/{total_size} bytes)")
-                    
-                    # Adaptive delay based on chunk size
-                    await asyncio.sleep(0.02)
-                
-                # Wait longer for large files
-                wait_time = min(2.0, 0.5 + (total_size / (1024 * 1024)))  # Scale with file size
-                print(f"[QUIC] Waiting {wait_time:.2f}s for transmission to complete...")
-                await asyncio.sleep(wait_time)
-                
-            else:
-                # No file data, close stream
-                client._quic.send_stream_data(stream_id, b"", end_stream=True)
-                client.transmit()
-                await asyncio.sleep(0.5)
+
+                if codec:
+                    print(f"[QUIC] Sent {total_size} bytes as {wire_bytes} with {codec}")
             
-            # Try to receive acknowledgment (if server implements it)
-            try:
-                # Wait a bit for potential response
-                await asyncio.sleep(0.2)
-                
-                # Check for any received data on the stream
-                events = client._quic._events
-                for event in events:
-                    if hasattr(event, 'stream_id') and event.stream_id == stream_id:
-                        if hasattr(event, 'data'):
-                            response = event.data.decode('utf-8', errors='ignore')
-                            print(f"[QUIC] Server response: {response}")
-            except Exception as e:
-                # Acknowledgment is optional, don't fail if not present
-                print(f"[QUIC] No acknowledgment received (this is OK): {e}")
+            # The server replies on the same stream once the command is done
+            response_timeout = RESPONSE_TIMEOUT
+            if manifest is not None or command == "stripe_commit":
+                # It checks (and may sync) the whole file before answering
+                response_timeout += (header_fields or {}).get("size", total_size) / VERIFY_RATE
+            result = await asyncio.wait_for(response, response_timeout)
+            print(f"[QUIC] Server response: { {k: v for k, v in result.items() if k != 'body'} }")
+            
+            if result.get("status") != "success":
+                raise TransferError(result.get("error", "Server reported failure"),
+                                    retryable=bool(result.get("retryable")), response=result)
+            
+            if command in ("copy", "move", "range", "pack"):
+                if result.get("bytes") != total_size:
+                    raise TransferError(
+                        f"Server wrote {result.get('bytes')} of {total_size} bytes", response=result
+                    )
+                if result.get("checksum") != f"crc32:{checksum:08x}":
+                    raise TransferError(
+                        f"Checksum mismatch: sent crc32:{checksum:08x}, server has {result.get('checksum')}",
+                        response=result
+                    )
+                if hasher is not None and result.get("digest") != f"{digest}:{hasher.digest().hex()}":
+                    raise TransferError(
+                        f"Digest mismatch: sent {digest}:{hasher.digest().hex()}, server has {result.get('digest')}",
+                        response=result
+                    )
+            # Older servers ignore the manifest and report no root
+            if manifest is not None and result.get("manifest_root", manifest.root.hex()) != manifest.root.hex():
+                raise TransferError(
+                    f"Manifest mismatch: sent root {manifest.root.hex()}, server has {result.get('manifest_root')}",
+                    response=result
+                )
             
-            print(f"[QUIC] Command sent successfully")
+            print(f"[QUIC] Command completed successfully")
+            result["wire_bytes"] = wire_bytes
+            result["compression"] = codec
+            return result
             
     except ConnectionRefusedError:
         print(f"[QUIC] Connection refused by {host}:{port}")
         raise Exception(f"Cannot connect to {host}:{port} - is the QUIC server running?")
     except asyncio.TimeoutError:
-        print(f"[QUIC] Timeout connecting to {host}:{port}")
-        raise Exception(f"Timeout connecting to {host}:{port}")
+        print(f"[QUIC] Timeout waiting for {host}:{port}")
+        raise TransferError(f"Timeout waiting for {host}:{port}")
+    except TransferError as e:
+        print(f"[QUIC] Command failed: {e}")
+        raise
     except Exception as e:
         print(f"[QUIC] Error: {e}")
         import traceback
         traceback.print_exc()
         raise
 
+def _body_pieces(body_parts, compression):
+    """
+    Yield (bytes to send, original bytes they carry) for a command body.
+    Uncompressed parts go out as they are; compressed ones as one block per
+    CHUNK_SIZE of original data.
+    """
+    body_parts = [part for part in body_parts if len(part)]
+    if not compression:
+        for part in body_parts:
+            yield part, part
+        return
+
+    compressor = ChunkCompressor(compression)
+    for part in body_parts:
+        for offset in range(0, len(part), CHUNK_SIZE):
+            chunk = part[offset:offset + CHUNK_SIZE]
+            yield compressor.pack(chunk), chunk
+
+
+def _pick_codec(requested, server_codecs):
+    """
+    Codec for a requested compression ("auto" for the best one both sides
+    have, or a codec name) given what the server decodes; None for off.
+    """
+    if not requested or requested == "none":
+        return None
+    candidates = available_codecs() if requested == "auto" else [requested]
+    return next((codec for codec in candidates if codec in server_codecs), None)
+
+
+async def build_manifest_for(host, port, cert_verify, filedata, source_fd=None):
+    """
+    Chunk manifest of filedata in a digest the server supports, hashed on
+    all cores (or taken from the hash cache when source_fd, the open file
+    filedata came from, is unchanged); None for files under
+    MANIFEST_THRESHOLD or servers without digests.
+    """
+    if len(filedata) < MANIFEST_THRESHOLD:
+        return None
+    config = quic_configuration(is_client=True, verify_mode=0)
+    if cert_verify:
+        config.load_verify_locations(cert_verify)
+    async with quic_pool.connection(host, port, config) as client:
+        features = await client.peer_features()
+    algorithm = choose_hash(features.get("hashes", []))
+    if algorithm is None:
+        return None
+    return await asyncio.to_thread(file_manifest, filedata, algorithm, source_fd)
+
+
+async def send_copy(host, port, cert_verify, src, dest, filedata, compression=None, source_fd=None,
+                    metadata=None):
+    """
+    Copy a file in one stream. Larger files carry a chunk manifest; if the
+    server finds corrupt chunks it keeps the rest as a striped transfer and
+    only those chunks are sent again. metadata ({"mode", "mtime_ns"}) is
+    applied to the file before it is moved into place.
+    """
+    manifest = await build_manifest_for(host, port, cert_verify, filedata, source_fd)
+    try:
+        return await send_quic_command(host, port, cert_verify, "copy", src=src, dest=dest, filedata=filedata,
+                                       header_fields=metadata, compression=compression, manifest=manifest)
+    except TransferError as e:
+        repair_id = (e.response or {}).get("transfer_id")
+        if manifest is None or not repair_id:
+            raise
+        print(f"[QUIC] {e}; resending {len(e.response.get('missing', []))} range(s)")
+        return await send_striped(host, port, cert_verify, dest, filedata, stripes=1,
+                                  range_size=DEFAULT_RANGE_SIZE, transfer_id=repair_id,
+                                  compression=compression, manifest=manifest, metadata=metadata)
+
+
+async def send_striped(host, port, cert_verify, dest, filedata, stripes, range_size, connections=1,
+                        transfer_id=None, compression=None, manifest=None, source_fd=None, metadata=None):
+    """
+    Send one file as offset-addressed ranges over `stripes` concurrent streams,
+    spread across `connections` pooled connections. The server preallocates
+    the target and only moves it into place once every range has arrived.
+    Ranges the server already holds for this transfer_id are skipped, so a
+    stable transfer_id (see resume_id) makes the transfer resumable.
+
+    The chunk manifest is built while the ranges go out and sent with the
+    first range after it is ready, so the server verifies chunks as they
+    arrive; stripe_commit carries it again and chunks the server found
+    corrupt are sent again.
+    """
+    total_size = len(filedata)
+    transfer_id = transfer_id or uuid.uuid4().hex
+    started = time.monotonic()
+    manifest_task = None
+    if manifest is None:
+        manifest_task = asyncio.ensure_future(build_manifest_for(host, port, cert_verify, filedata, source_fd))
+
+    begin = await send_quic_command(host, port, cert_verify, "stripe_begin", dest=dest,
+                                    header_fields={"transfer_id": transfer_id, "size": total_size},
+                                    manifest=manifest)
+    present = begin.get("bytes", 0)
+    if present:
+        print(f"[QUIC] Resuming: server already has {present}/{total_size} bytes")
+
+    pending = collections.deque()
+    for start, stop in missing_ranges(begin.get("ranges", []), total_size):
+        pending.extend(split_range(start, stop, range_size))
+    print(f"[QUIC] Striping {total_size - present} bytes as {len(pending)} range(s) over {stripes} stream(s)")
+
+    wire_bytes = 0
+    codec = None
+    manifest_sent = manifest is not None
+
+    async def stripe_worker(index):
+        nonlocal wire_bytes, codec, manifest_sent
+        while pending:
+            start, stop = pending.popleft()
+            carried = None
+            if not manifest_sent and manifest_task.done() and not manifest_task.exception():
+                carried = manifest_task.result()
+                manifest_sent = True
+            for attempt in range(1, RANGE_RETRIES + 1):
+                try:
+                    sent = await send_quic_command(host, port, cert_verify, "range", dest=dest,
+                                                   filedata=filedata[start:stop],
+                                                   header_fields={"transfer_id": transfer_id, "offset": start},
+                                                   lane=index % connections, compression=compression,
+                                                   manifest=carried)
+                    wire_bytes += sent["wire_bytes"]
+                    codec = sent["compression"]
+                    break
+                except TransferError as e:
+                    if not e.retryable or attempt == RANGE_RETRIES:
+                        raise
+                    print(f"[QUIC] Range {start}-{stop} failed ({e}), retrying")
+
+    try:
+        await asyncio.gather(*(stripe_worker(i) for i in range(stripes)))
+        if manifest_task is not None:
+            manifest = await manifest_task
+    finally:
+        if manifest_task is not None:
+            manifest_task.cancel()
+
+    for attempt in range(1, RANGE_RETRIES + 1):
+        try:
+            result = await send_quic_command(host, port, cert_verify, "stripe_commit", dest=dest,
+                                             header_fields={"transfer_id": transfer_id, "size": total_size,
+                                                            **(metadata or {})},
+                                             manifest=manifest)
+            break
+        except TransferError as e:
+            missing = (e.response or {}).get("missing")
+            if not missing or not e.retryable or attempt == RANGE_RETRIES:
+                raise
+            # Chunks that failed the manifest check are missing again
+            print(f"[QUIC] {e}; resending {len(missing)} range(s)")
+            for start, stop in missing:
+                pending.extend(split_range(start, stop, range_size))
+            await asyncio.gather(*(stripe_worker(i) for i in range(stripes)))
+    # Each range was checked against its own CRC32; there is no whole-file one
+    result.pop("checksum", None)
+    result["bytes"] = total_size
+    result["resumed_bytes"] = present
+    result["wire_bytes"] = wire_bytes
+    result["compression"] = codec
+    result["elapsed"] = round(time.monotonic() - started, 6)
+    return result
+
+
+async def send_delta(host, port, cert_verify, dest, filedata, compression=None, source_fd=None, metadata=None):
+    """
+    rsync-style update of an existing remote file: fetch the signature of
+    the server's copy of dest, then send only the blocks it lacks plus copy
+    instructions for the rest. Falls back to a full copy when dest does not
+    exist yet (or cannot be read) on the server.
+    """
+    started = time.monotonic()
+    try:
+        signature = await send_quic_command(host, port, cert_verify, "signature", dest=dest,
+                                            response_body_limit=SIGNATURE_LIMIT)
+    except TransferError as e:
+        if e.retryable:
+            raise
+        print(f"[QUIC] No basis for delta ({e}), sending the whole file")
+        return await send_quic_command(host, port, cert_verify, "copy", dest=dest, filedata=filedata,
+                                       header_fields=metadata, compression=compression)
+
+    block_size = signature["block_size"]
+    parts = await asyncio.to_thread(compute_delta, filedata, signature["body"], block_size)
+    checksum = await asyncio.to_thread(_file_crc32, filedata, source_fd)
+    delta_size = sum(len(part) for part in parts)
+    print(f"[QUIC] Delta: {delta_size} bytes on the wire for {len(filedata)} byte file")
+
+    result = await send_quic_command(host, port, cert_verify, "delta", dest=dest, body_parts=parts,
+                                     header_fields={"size": len(filedata), "block_size": block_size,
+                                                    **(metadata or {})},
+                                     compression=compression)
+    if result.get("bytes") != len(filedata):
+        raise TransferError(f"Server rebuilt {result.get('bytes')} of {len(filedata)} bytes", response=result)
+    if result.get("checksum") != f"crc32:{checksum:08x}":
+        raise TransferError(
+            f"Checksum mismatch after delta: expected crc32:{checksum:08x}, server has {result.get('checksum')}",
+            response=result
+        )
+    result["delta_bytes"] = delta_size
+    result["elapsed"] = round(time.monotonic() - started, 6)
+    return result
+
+
+def _file_crc32(filedata, source_fd=None):
+    """CRC32 of a file's contents, cached for the open file source_fd when given"""
+    if source_fd is None:
+        return zlib.crc32(filedata)
+    packed = cached_digest(None, "crc32", lambda: zlib.crc32(filedata).to_bytes(4, "big"), fd=source_fd)
+    return int.from_bytes(packed, "big")
+
+
+async def send_file(host, port, cert_verify, src, dest, filedata, options, source_fd=None, metadata=None):
+    """
+    Send one mapped file the way options (see _transfer_options) ask: as a
+    delta, striped and resumable, or in a single stream. With metadata
+    ({"mode", "mtime_ns"}) the server gives the file the sender's
+    permission bits and mtime, as packed files get.
+    """
+    stripes = options["stripes"] or (DEFAULT_STRIPES if len(filedata) >= STRIPE_THRESHOLD else 1)
+    if options["mode"] == "delta":
+        return await send_delta(host, port, cert_verify, dest, filedata,
+                                compression=options["compression"], source_fd=source_fd, metadata=metadata)
+    if stripes > 1 or len(filedata) >= RESUME_THRESHOLD:
+        if stripes > 1:
+            print(f"[QUIC] Striped: {stripes} streams, {options['range_size']} byte ranges, "
+                  f"{options['connections']} connection(s)")
+        return await send_striped(host, port, cert_verify, dest, filedata, stripes=stripes,
+                                  range_size=options["range_size"], connections=options["connections"],
+                                  transfer_id=resume_id(src, host, dest),
+                                  compression=options["compression"], source_fd=source_fd, metadata=metadata)
+    return await send_copy(host, port, cert_verify, os.path.basename(src), dest, filedata,
+                           compression=options["compression"], source_fd=source_fd, metadata=metadata)
+
+
+async def send_file_with_retries(host, port, cert_verify, src, dest, filedata, options, source_fd=None,
+                                 metadata=None):
+    """
+    send_file(), retried up to TRANSFER_RETRIES times unless the server
+    rejects the command outright. Returns (result, attempts, last error),
+    with result None if every attempt failed.
+    """
+    return await _with_retries(
+        src, host, port, lambda: send_file(host, port, cert_verify, src, dest, filedata, options, source_fd, metadata))
+
+
+async def _with_retries(what, host, port, send):
+    """Await send() until it succeeds, as send_file_with_retries() does"""
+    last_error = None
+    for attempt in range(1, TRANSFER_RETRIES + 1):
+        try:
+            print(f"[API] Transfer attempt {attempt}/{TRANSFER_RETRIES} of {what}")
+            result = await send()
+            print(f"[API] Transfer of {what} successful on attempt {attempt}")
+            return result, attempt, None
+
+        except TransferError as e:
+            last_error = e
+            print(f"[API] Attempt {attempt} failed: {e}")
+            if not e.retryable:
+                # The server rejected the command; resending won't help
+                return None, attempt, e
+
+        except ConnectionRefusedError as e:
+            last_error = e
+            print(f"[API] Attempt {attempt} failed: Connection refused to {host}:{port}. Is the QUIC server running?")
+
+        except asyncio.TimeoutError as e:
+            last_error = e
+            print(f"[API] Attempt {attempt} failed: Timeout connecting to {host}:{port}")
+
+        except Exception as e:
+            last_error = e
+            print(f"[API] Attempt {attempt} failed: {e}")
+            import traceback
+            traceback.print_exc()
+
+        if attempt < TRANSFER_RETRIES:
+            print(f"[API] Retrying in {RETRY_DELAY}s...")
+            await asyncio.sleep(RETRY_DELAY)
+        else:
+            print(f"[API] All {TRANSFER_RETRIES} attempts failed")
+    return None, TRANSFER_RETRIES, last_error
+
+
+async def send_batch(host, port, cert_verify, files, options, concurrency=BATCH_CONCURRENCY):
+    """
+    Send files ({"src", "dest"} dicts) to one peer, `concurrency` at a
+    time. They share the pooled connection (each file on its own streams),
+    so the batch pays for one handshake. Returns one result per file, in
+    order; a failed file does not stop the others.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_one(entry):
+        async with semaphore:
+            return await _send_batch_entry(host, port, cert_verify, entry["src"], entry["dest"], options)
+
+    return await asyncio.gather(*(send_one(entry) for entry in files))
+
+
+async def _send_batch_entry(host, port, cert_verify, src, dest, options, preserve=False):
+    """Send one file of a batch or tree; with preserve, its mode and mtime go along"""
+    entry = {"src": src, "dest": dest}
+    try:
+        src_file = open(src, "rb")
+    except OSError as e:
+        entry.update(status="error", error=f"Cannot read {src}: {e.strerror or e}", attempts=0)
+        return entry
+    with src_file:
+        st = os.fstat(src_file.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            entry.update(status="error", error=f"Source is not a file: {src}", attempts=0)
+            return entry
+        metadata = {"mode": st.st_mode, "mtime_ns": st.st_mtime_ns} if preserve else None
+        with map_file(src_file) as filedata:
+            result, attempts, last_error = await send_file_with_retries(
+                host, port, cert_verify, src, dest, filedata, options, src_file.fileno(), metadata)
+            size = len(filedata)
+
+    if result is None:
+        entry.update(status="error", error=str(last_error), attempts=attempts)
+        return entry
+    entry.update(
+        status="success",
+        bytes_transferred=result.get("bytes", size),
+        elapsed=result.get("elapsed"),
+        checksum=result.get("checksum"),
+        resumed_bytes=result.get("resumed_bytes", 0),
+        delta_bytes=result.get("delta_bytes"),
+        wire_bytes=result.get("wire_bytes"),
+        compression=result.get("compression"),
+        attempts=attempts
+    )
+    return entry
+
+
+async def send_pack(host, port, cert_verify, src_root, dest_root, paths, compression=None):
+    """
+    Send small files (paths relative to src_root) in one pack stream,
+    unpacked by the server below dest_root. Files that cannot be read are
+    left out and listed in result["unreadable"] as (src, error) pairs.
+    """
+    parts, unreadable, data_bytes = await asyncio.to_thread(_read_pack, src_root, paths)
+    result = await send_quic_command(host, port, cert_verify, "pack", dest=dest_root, body_parts=parts,
+                                     compression=compression)
+    if result.get("files") != len(paths) - len(unreadable):
+        raise TransferError(f"Server unpacked {result.get('files')} of {len(paths) - len(unreadable)} files",
+                            response=result)
+    result["data_bytes"] = data_bytes
+    result["unreadable"] = unreadable
+    return result
+
+
+def _read_pack(src_root, paths):
+    """Pack entries (see packing.py) for files below src_root, plus the ones that could not be read"""
+    parts = []
+    unreadable = []
+    data_bytes = 0
+    for path in paths:
+        src = os.path.join(src_root, *path.split("/"))
+        try:
+            with open(src, "rb") as f:
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except OSError as e:
+            unreadable.append((src, f"Cannot read {src}: {e.strerror or e}"))
+            continue
+        parts.append(entry_header(path, len(data), st.st_mode, st.st_mtime_ns))
+        parts.append(data)
+        data_bytes += len(data)
+    return parts, unreadable, data_bytes
+
+
+async def send_tree(host, port, cert_verify, src_root, dest_root, options, concurrency=TREE_CONCURRENCY):
+    """
+    Send a directory tree to dest_root: first its directories, in as few
+    mkdir commands as their paths fit in, then its files, `concurrency` at
+    a time over the pooled connection. Files up to options["pack_threshold"]
+    bytes go many to a stream (see send_pack); larger ones get their own.
+    Either way files keep their permission bits and mtime.
+    The tree is walked in a thread that hands entries over a batch at a
+    time through a bounded queue, so memory stays flat however many files
+    it holds. Returns counts, bytes and the first TREE_ERRORS_KEPT failures.
+    """
+    loop = asyncio.get_running_loop()
+    threshold = options["pack_threshold"]
+    summary = {"directories": 0, "files": 0, "packed": 0, "packs": 0, "failed": 0, "bytes_transferred": 0,
+               "errors": []}
+
+    def record_error(path, error):
+        summary["failed"] += 1
+        if len(summary["errors"]) < TREE_ERRORS_KEPT:
+            summary["errors"].append({"src": path, "error": error})
+
+    def walk_error(path, error):
+        # Called on the walking thread
+        loop.call_soon_threadsafe(record_error, os.path.join(src_root, *path.split("/")), f"Cannot read: {error}")
+
+    # Metadata pass: the directory structure, root included
+    batches = mkdir_batches(path for path, _, _ in walk_tree(src_root, dirs_only=True, on_error=walk_error))
+    batch = await asyncio.to_thread(next, batches, [])
+    while True:
+        result = await send_quic_command(host, port, cert_verify, "mkdir", dest=dest_root,
+                                         header_fields={"dirs": batch})
+        summary["directories"] += result.get("created", 0)
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            break
+
+    # Files, walked again and sent as the queue drains
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def send_packed(paths):
+        result, _, last_error = await _with_retries(
+            f"{len(paths)} packed files", host, port,
+            lambda: send_pack(host, port, cert_verify, src_root, dest_root, paths, options["compression"]))
+        if result is None:
+            for path in paths:
+                record_error(os.path.join(src_root, *path.split("/")), str(last_error))
+            return
+        summary["files"] += result["files"]
+        summary["packed"] += result["files"]
+        summary["packs"] += 1
+        summary["bytes_transferred"] += result["data_bytes"]
+        for src, error in result["unreadable"]:
+            record_error(src, error)
+
+    async def send_files():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            kind, path = item
+            if kind == "pack":
+                await send_packed(path)
+                continue
+            entry = await _send_batch_entry(host, port, cert_verify, os.path.join(src_root, *path.split("/")),
+                                            dest_root.rstrip("/\\") + "/" + path, options, preserve=True)
+            if entry["status"] == "success":
+                summary["files"] += 1
+                summary["bytes_transferred"] += entry["bytes_transferred"]
+            else:
+                record_error(entry["src"], entry["error"])
+
+    senders = [asyncio.ensure_future(send_files()) for _ in range(concurrency)]
+    walker = walk_tree(src_root, on_error=walk_error)
+    pack = []
+    pack_bytes = 0
+    try:
+        while True:
+            entries = await asyncio.to_thread(lambda: list(itertools.islice(walker, WALK_BATCH)))
+            if not entries:
+                break
+            for path, is_dir, size in entries:
+                if is_dir:
+                    continue
+                if size > threshold or threshold <= 0:
+                    await queue.put(("file", path))
+                    continue
+                pack.append(path)
+                pack_bytes += size
+                if len(pack) >= PACK_ENTRIES or pack_bytes >= PACK_BYTES:
+                    await queue.put(("pack", pack))
+                    pack = []
+                    pack_bytes = 0
+        if pack:
+            await queue.put(("pack", pack))
+        for _ in senders:
+            await queue.put(None)
+        await asyncio.gather(*senders)
+    finally:
+        walker.close()
+        for sender in senders:
+            sender.cancel()
+    return summary
+
+
+def resume_id(src, dest_host, dest):
+    """
+    Stable transfer id for sending src to dest_host:dest. It changes whenever
+    the source file changes, so a retry (even after restarting client.py)
+    resumes the server's partial file only if it is still the same data.
+    """
+    st = os.stat(src)
+    key = f"{os.path.abspath(src)}|{st.st_size}|{st.st_mtime_ns}|{dest_host}|{dest}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+@contextmanager
+def map_file(f):
+    """
+    Memory-map an open file and yield a read-only memoryview of it.
+    Empty files cannot be mapped and yield an empty view instead.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        yield memoryview(b"")
+        return
+
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    try:
+        yield view
+    finally:
+        try:
+            view.release()
+            mapped.close()
+        except BufferError:
+            # A traceback still holds a slice; the map goes away with it
+            pass
+
+
 def check_subnet(ip):
     env = load_env_vars()
     host_ip = env["host"]
@@ -152,10 +912,22 @@ def get_OS_TYPE(REMOTE_HOST=""):
 def transfer():
     """
     Transfer file to remote peer via QUIC with retry logic
+    Body: {
+        "src": "/absolute/path/to/local/file",
+        "dest": "/absolute/path/on/destination/host",
+        "dest_host": "optional override of DEST_HOST",
+        "port": "optional override of PORT",
+        "stripes": "optional number of concurrent streams for one file",
+        "range_size": "optional bytes per striped range",
+        "connections": "optional number of connections to spread stripes over",
+        "mode": "optional; \"delta\" sends only the blocks that differ from the existing dest",
+        "compression": "optional; \"auto\" or a codec name (zstd, lz4, zlib) to compress the data",
+        "concurrency": "optional; when src is a directory, files sent at once (default TREE_CONCURRENCY)",
+        "pack_threshold": "optional; when src is a directory, files up to this many bytes are packed
+            many to a stream (default PACK_THRESHOLD_KB from .env, or 64KB; 0 disables packing)"
+    }
+    A directory src is sent recursively to dest (see send_tree).
     """
-    MAX_RETRIES = 3
-    RETRY_DELAY = 1.0
-    
     try:
         data = request.get_json()
         
@@ -174,112 +946,130 @@ def transfer():
         if not os.path.exists(src):
             return jsonify({"error": f"Source file not found: {src}"}), 404
         
+        if os.path.isdir(src):
+            return _transfer_directory(data, src, dest)
+
         if not os.path.isfile(src):
             return jsonify({"error": f"Source is not a file: {src}"}), 400
 
-        # Read file data
+        # Map the file instead of reading it so transfers larger than RAM work
         try:
-            with open(src, "rb") as f:
-                filedata = f.read()
+            src_file = open(src, "rb")
         except PermissionError:
             return jsonify({"error": f"Permission denied reading: {src}"}), 403
         except Exception as e:
             return jsonify({"error": f"Failed to read file: {str(e)}"}), 500
 
+        with src_file, map_file(src_file) as filedata:
+            return _transfer_mapped(data, src, dest, filedata, src_file.fileno())
+
+    except Exception as e:
+        print(f"[ERROR] Unexpected error in /transfer: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "error": f"Internal server error: {str(e)}",
+            "type": type(e).__name__
+        }), 500
+
+
+def _destination(data, env):
+    """(dest_host, port, cert) of a transfer request, falling back to .env; raises ValueError"""
+    dest_host = data.get("dest_host")  # Allow override from request
+    if not dest_host:
+        dest_host = env.get("dest_host") or env.get("DEST_HOST") or env.get("dest")
+    if not dest_host:
+        raise ValueError("dest_host not configured. Set DEST_HOST in .env or provide dest_host in request body")
+
+    port_str = data.get("port")  # Allow override from request
+    if not port_str:
+        port_str = env.get("port") or env.get("PORT")
+    if not port_str:
+        raise ValueError("port not configured. Set PORT in .env or provide port in request body")
+    try:
+        port = int(port_str)
+    except ValueError:
+        raise ValueError(f"Invalid port value: {port_str}")
+
+    # Certificate is optional
+    return dest_host, port, env.get("certi") or env.get("CERTI")
+
+
+def _transfer_options(data):
+    """Validated stripes/range_size/connections/mode/compression of a transfer request; raises ValueError"""
+    try:
+        stripes = int(data["stripes"]) if data.get("stripes") else None
+        range_size = int(data.get("range_size") or DEFAULT_RANGE_SIZE)
+        connections = int(data.get("connections") or 1)
+    except (TypeError, ValueError):
+        raise ValueError("stripes, range_size and connections must be integers")
+    if (stripes is not None and stripes < 1) or range_size < 1 or connections < 1:
+        raise ValueError("stripes, range_size and connections must be positive")
+    mode = data.get("mode") or "full"
+    if mode not in ("full", "delta"):
+        raise ValueError(f"Unknown mode: {mode}")
+    compression = data.get("compression") or "none"
+    if compression not in ("auto", "none") and compression not in CODECS:
+        raise ValueError(f"Unsupported compression: {compression}")
+    try:
+        threshold = int(data["pack_threshold"]) if data.get("pack_threshold") is not None else pack_threshold()
+    except (TypeError, ValueError):
+        raise ValueError("pack_threshold must be an integer")
+    return {"stripes": stripes, "range_size": range_size, "connections": connections,
+            "mode": mode, "compression": compression, "pack_threshold": threshold}
+
+
+def _transfer_mapped(data, src, dest, filedata, source_fd=None):
+    """Send an already mapped source file (read from source_fd) with retry logic"""
+    try:
         # Load environment variables
         try:
             env = load_env_vars()
         except Exception as e:
             return jsonify({"error": f"Failed to load environment: {str(e)}"}), 500
-        
-        # Get destination host - try multiple keys
-        dest_host = data.get("dest_host")  # Allow override from request
-        if not dest_host:
-            dest_host = env.get("dest_host") or env.get("DEST_HOST") or env.get("dest")
-        
-        if not dest_host:
-            return jsonify({
-                "error": "dest_host not configured. Set DEST_HOST in .env or provide dest_host in request body",
-                "env_keys": list(env.keys())
-            }), 500
-        
-        # Get port
-        port_str = data.get("port")  # Allow override from request
-        if not port_str:
-            port_str = env.get("port") or env.get("PORT")
-        
-        if not port_str:
-            return jsonify({
-                "error": "port not configured. Set PORT in .env or provide port in request body",
-                "env_keys": list(env.keys())
-            }), 500
-        
+
         try:
-            port = int(port_str)
-        except ValueError:
-            return jsonify({"error": f"Invalid port value: {port_str}"}), 500
-        
-        # Get certificate (optional)
-        certi = env.get("certi") or env.get("CERTI")
+            dest_host, port, certi = _destination(data, env)
+        except ValueError as e:
+            return jsonify({"error": str(e), "env_keys": list(env.keys())}), 500
+        try:
+            options = _transfer_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         print(f"[API] Transfer: {src} -> {dest_host}:{port} -> {dest}")
         print(f"[API] File size: {len(filedata)} bytes")
         print(f"[API] Certificate: {certi}")
-        
-        # Retry logic
-        last_error = None
-        for attempt in range(1, MAX_RETRIES + 1):
-            try:
-                print(f"[API] Transfer attempt {attempt}/{MAX_RETRIES}")
-                
-                # Run async QUIC command
-                asyncio.run(send_quic_command(
-                    host=dest_host,
-                    port=port,
-                    cert_verify=certi,
-                    command="copy",
-                    src=os.path.basename(src),
-                    dest=dest,
-                    filedata=filedata
-                ))
-                
-                # If we get here, transfer succeeded
-                print(f"[API] Transfer successful on attempt {attempt}")
-                return jsonify({
-                    "status": "success",
-                    "message": f"Transferred {os.path.basename(src)} to {dest_host}:{dest}",
-                    "bytes_transferred": len(filedata),
-                    "attempts": attempt
-                }), 200
-                
-            except ConnectionRefusedError as e:
-                last_error = e
-                error_msg = f"Connection refused to {dest_host}:{port}. Is the QUIC server running?"
-                print(f"[API] Attempt {attempt} failed: {error_msg}")
-                
-            except asyncio.TimeoutError as e:
-                last_error = e
-                error_msg = f"Timeout connecting to {dest_host}:{port}"
-                print(f"[API] Attempt {attempt} failed: {error_msg}")
-                
-            except Exception as e:
-                last_error = e
-                error_msg = str(e)
-                print(f"[API] Attempt {attempt} failed: {error_msg}")
-                import traceback
-                traceback.print_exc()
-            
-            # Retry delay if not last attempt
-            if attempt < MAX_RETRIES:
-                print(f"[API] Retrying in {RETRY_DELAY}s...")
-                import time
-                time.sleep(RETRY_DELAY)
-            else:
-                print(f"[API] All {MAX_RETRIES} attempts failed")
-        
+
+        # Run on the shared QUIC loop; returns once the server confirms the write
+        result, attempt, last_error = run_quic(send_file_with_retries(
+            host=dest_host,
+            port=port,
+            cert_verify=certi,
+            src=src,
+            dest=dest,
+            filedata=filedata,
+            options=options,
+            source_fd=source_fd
+        ))
+
+        if result is not None:
+            return jsonify({
+                "status": "success",
+                "message": f"Transferred {os.path.basename(src)} to {dest_host}:{dest}",
+                "bytes_transferred": result.get("bytes", len(filedata)),
+                "elapsed": result.get("elapsed"),
+                "checksum": result.get("checksum"),
+                "resumed_bytes": result.get("resumed_bytes", 0),
+                "delta_bytes": result.get("delta_bytes"),
+                "wire_bytes": result.get("wire_bytes"),
+                "compression": result.get("compression"),
+                "attempts": attempt
+            }), 200
+
         # If we get here, all retries failed
         return jsonify({
-            "error": f"QUIC transfer failed after {MAX_RETRIES} attempts",
+            "error": f"QUIC transfer failed after {attempt} attempts",
             "last_error": str(last_error),
             "dest_host": dest_host,
             "port": port
@@ -295,6 +1085,142 @@ def transfer():
         }), 500
 
 
+def _transfer_directory(data, src, dest):
+    """Send the directory tree at src (see send_tree) and summarize the result"""
+    try:
+        try:
+            env = load_env_vars()
+        except Exception as e:
+            return jsonify({"error": f"Failed to load environment: {str(e)}"}), 500
+        try:
+            dest_host, port, certi = _destination(data, env)
+        except ValueError as e:
+            return jsonify({"error": str(e), "env_keys": list(env.keys())}), 500
+        try:
+            options = _transfer_options(data)
+            concurrency = int(data.get("concurrency") or TREE_CONCURRENCY)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        if concurrency < 1:
+            return jsonify({"error": "concurrency must be positive"}), 400
+
+        print(f"[API] Directory transfer: {src} -> {dest_host}:{port} -> {dest}, {concurrency} files at a time")
+        started = time.monotonic()
+        try:
+            summary = run_quic(send_tree(dest_host, port, certi, src, dest, options, concurrency))
+        except Exception as e:
+            print(f"[API] Directory transfer failed: {e}")
+            return jsonify({
+                "error": f"Directory transfer failed: {e}",
+                "dest_host": dest_host,
+                "port": port
+            }), 500
+        elapsed = time.monotonic() - started
+
+        print(f"[API] Directory transfer: {summary['files']} file(s), {summary['failed']} failed, "
+              f"{summary['bytes_transferred']} bytes in {elapsed:.2f}s")
+        if not summary["failed"]:
+            status = "success"
+        else:
+            status = "partial" if summary["files"] else "error"
+        summary.update(
+            status=status,
+            message=f"Transferred {summary['files']} file(s) from {src} to {dest_host}:{dest}",
+            elapsed=round(elapsed, 6),
+            throughput_mb_per_s=round(summary["bytes_transferred"] / elapsed / (1024 * 1024), 2) if elapsed > 0 else None
+        )
+        return jsonify(summary), 200
+
+    except Exception as e:
+        print(f"[ERROR] Unexpected error in /transfer: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "error": f"Internal server error: {str(e)}",
+            "type": type(e).__name__
+        }), 500
+
+
+@app.route('/transfer_batch', methods=['POST'])
+def transfer_batch():
+    """
+    Transfer many files to one remote peer over a shared QUIC connection,
+    `concurrency` files at a time, each retried on its own
+    Body: {
+        "files": [{"src": "/absolute/local/path", "dest": "/absolute/remote/path"}, ...],
+        "concurrency": "optional number of files sent at once (default BATCH_CONCURRENCY)",
+        "dest_host", "port", "stripes", "range_size", "connections", "mode", "compression":
+            optional, as for /transfer, applied to every file
+    }
+    Returns per-file results (in request order) and the aggregate throughput,
+    with status "success", "partial" or "error" (nothing sent), always as
+    HTTP 200 so callers get the per-file errors.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No JSON data provided"}), 400
+
+        files = data.get("files")
+        if not isinstance(files, list) or not files:
+            return jsonify({"error": "files (list of {src, dest}) is required"}), 400
+        for entry in files:
+            if not isinstance(entry, dict) or not entry.get("src") or not entry.get("dest"):
+                return jsonify({"error": f"Each file needs src and dest: {entry!r}"}), 400
+        try:
+            concurrency = int(data.get("concurrency") or BATCH_CONCURRENCY)
+        except (TypeError, ValueError):
+            return jsonify({"error": "concurrency must be an integer"}), 400
+        if concurrency < 1:
+            return jsonify({"error": "concurrency must be positive"}), 400
+
+        try:
+            env = load_env_vars()
+        except Exception as e:
+            return jsonify({"error": f"Failed to load environment: {str(e)}"}), 500
+        try:
+            dest_host, port, certi = _destination(data, env)
+        except ValueError as e:
+            return jsonify({"error": str(e), "env_keys": list(env.keys())}), 500
+        try:
+            options = _transfer_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        print(f"[API] Batch transfer: {len(files)} file(s) -> {dest_host}:{port}, {concurrency} at a time")
+        started = time.monotonic()
+        results = run_quic(send_batch(dest_host, port, certi, files, options, concurrency))
+        elapsed = time.monotonic() - started
+
+        succeeded = [result for result in results if result["status"] == "success"]
+        total_bytes = sum(result["bytes_transferred"] for result in succeeded)
+        print(f"[API] Batch transfer: {len(succeeded)}/{len(files)} file(s), {total_bytes} bytes in {elapsed:.2f}s")
+        if len(succeeded) == len(files):
+            status = "success"
+        else:
+            status = "partial" if succeeded else "error"
+        return jsonify({
+            "status": status,
+            "files": results,
+            "succeeded": len(succeeded),
+            "failed": len(files) - len(succeeded),
+            "bytes_transferred": total_bytes,
+            "elapsed": round(elapsed, 6),
+            "throughput_mb_per_s": round(total_bytes / elapsed / (1024 * 1024), 2) if elapsed > 0 else None,
+            "dest_host": dest_host,
+            "port": port
+        }), 200
+
+    except Exception as e:
+        print(f"[ERROR] Unexpected error in /transfer_batch: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "error": f"Internal server error: {str(e)}",
+            "type": type(e).__name__
+        }), 500
+
+
 
 @app.route('/transferremote', methods=['POST'])
 def transfer_remote():
@@ -395,7 +1321,7 @@ def delete_remote_file():
         print(f"[API] Delete remote: {src} on {dest_host}")
         
         # Use QUIC to delete file
-        asyncio.run(send_quic_command(
+        run_quic(send_quic_command(
             host=dest_host,
             port=port,
             cert_verify=certi,
@@ -451,7 +1377,32 @@ def delete_local_file():
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy"}), 200
+    cache = default_cache()
+    return jsonify({"status": "healthy", "quic_connections": quic_pool.stats(),
+                    "hash_cache": cache.stats() if cache is not None else None}), 200
+
+
+@app.route('/server_status', methods=['GET'])
+def server_status():
+    """
+    Resource usage of the QUIC server at dest_host (or ?host=): memory
+    budget, connections, open streams and queued disk operations
+    """
+    try:
+        env = load_env_vars()
+        host = request.args.get("host") or env.get("dest_host")
+        port = int(request.args.get("port") or env["port"])
+        if not host:
+            return jsonify({"error": "dest_host not configured"}), 500
+        result = run_quic(send_quic_command(host=host, port=port, cert_verify=env.get("certi"), command="status"))
+        result.pop("wire_bytes", None)
+        result.pop("compression", None)
+        return jsonify(result), 200
+    except TransferError as e:
+        return jsonify({"error": str(e)}), 502
+    except Exception as e:
+        print(f"[ERROR] Status request failed: {e}")
+        return jsonify({"error": str(e)}), 500
 
 
 @app.route("/listhost", methods=["GET"])
@@ -0,0 +1,167 @@
+"""
+Per-chunk compression for command bodies.
+
+A compressed body is a sequence of blocks, each a BLOCK_HEADER (flag, stored
+length, original length) followed by the stored bytes. Chunks that do not
+compress well are stored raw, and a short trial compression of each chunk
+decides that before the whole chunk is compressed, so media files cost one
+header per chunk and very little CPU.
+
+zlib is always available; zstd and lz4 are used when their packages
+(zstandard, lz4) are installed.
+"""
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+BLOCK_HEADER = struct.Struct(">BII")
+RAW = 0
+COMPRESSED = 1
+
+MAX_BLOCK_SIZE = 1024 * 1024  # Largest original block accepted by the decoder
+TRIAL_SIZE = 4096  # Leading bytes of a chunk compressed first to judge it
+MIN_RATIO = 0.9  # Chunks that do not shrink below this fraction of their size are sent raw
+MAX_SKIP = 64  # Most chunks sent raw without a trial after repeated misses
+ZLIB_LEVEL = 1
+ZSTD_LEVEL = 3
+
+
+def _zlib_decompress(data, size):
+    decompressor = zlib.decompressobj()
+    out = decompressor.decompress(data, size)
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError("zlib block does not match its declared size")
+    return out
+
+
+def _zstd_decompress(data, size):
+    # max_output_size only applies to frames without a content size, so a
+    # frame declaring a huge one must be turned away before decompressing
+    try:
+        if zstandard.frame_content_size(data) > size:
+            raise ValueError("zstd block does not match its declared size")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+    except zstandard.ZstdError as e:
+        raise ValueError(f"Invalid zstd block: {e}")
+
+
+def _lz4_decompress(data, size):
+    decompressor = lz4.frame.LZ4FrameDecompressor()
+    out = decompressor.decompress(data, max_length=size + 1)
+    if len(out) > size or not decompressor.eof or decompressor.unused_data:
+        raise ValueError("lz4 block does not match its declared size")
+    return out
+
+
+def _codecs():
+    codecs = {}
+    if zstandard is not None:
+        codecs["zstd"] = (
+            lambda: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress,
+            lambda: _zstd_decompress,
+        )
+    if lz4 is not None:
+        codecs["lz4"] = (
+            lambda: lz4.frame.compress,
+            lambda: _lz4_decompress,
+        )
+    codecs["zlib"] = (
+        lambda: (lambda data: zlib.compress(data, ZLIB_LEVEL)),
+        lambda: _zlib_decompress,
+    )
+    return codecs
+
+
+# name -> (compressor factory, decompressor factory), best first
+CODECS = _codecs()
+
+
+def available_codecs():
+    """Codec names supported by this process, best first"""
+    return list(CODECS)
+
+
+def choose_codec(offered):
+    """Pick the best codec from a peer's list that this process supports, or None"""
+    return next((name for name in CODECS if name in offered), None)
+
+
+class ChunkCompressor:
+    """
+    Frames body chunks as blocks, compressing those that are worth it.
+    After a run of incompressible chunks the trial itself is skipped for a
+    growing number of chunks (up to MAX_SKIP), then tried again.
+    """
+    def __init__(self, codec):
+        self.codec = codec
+        self._compress = CODECS[codec][0]()
+        self._misses = 0
+        self._skip = 0
+
+    def pack(self, chunk):
+        """Return the block for one chunk (at most MAX_BLOCK_SIZE bytes)"""
+        if self._skip:
+            self._skip -= 1
+            return self._block(RAW, chunk, len(chunk))
+
+        if len(chunk) > 2 * TRIAL_SIZE and len(self._compress(chunk[:TRIAL_SIZE])) > TRIAL_SIZE * MIN_RATIO:
+            return self._miss(chunk)
+
+        packed = self._compress(chunk)
+        if len(packed) > len(chunk) * MIN_RATIO:
+            return self._miss(chunk)
+        self._misses = 0
+        return self._block(COMPRESSED, packed, len(chunk))
+
+    def _miss(self, chunk):
+        self._misses += 1
+        self._skip = min(MAX_SKIP, 2 ** (self._misses - 1) - 1)
+        return self._block(RAW, chunk, len(chunk))
+
+    @staticmethod
+    def _block(flag, stored, size):
+        return BLOCK_HEADER.pack(flag, len(stored), size) + stored
+
+
+class BlockDecoder:
+    """Incrementally turns a compressed body back into the original bytes"""
+    def __init__(self, codec):
+        self.codec = codec
+        self._decompress = CODECS[codec][1]()
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Return the list of original byte strings completed by data"""
+        self._buffer += data
+        out = []
+        while len(self._buffer) >= BLOCK_HEADER.size:
+            flag, stored, size = BLOCK_HEADER.unpack_from(self._buffer)
+            if size > MAX_BLOCK_SIZE or stored > MAX_BLOCK_SIZE + BLOCK_HEADER.size:
+                raise ValueError(f"Compressed block too large ({stored} -> {size} bytes)")
+            end = BLOCK_HEADER.size + stored
+            if len(self._buffer) < end:
+                break
+
+            payload = bytes(self._buffer[BLOCK_HEADER.size:end])
+            del self._buffer[:end]
+            if flag == COMPRESSED:
+                payload = self._decompress(payload, size)
+            elif flag != RAW:
+                raise ValueError(f"Unknown block flag {flag}")
+            if len(payload) != size:
+                raise ValueError(f"Block decoded to {len(payload)} bytes, expected {size}")
+            out.append(payload)
+        return out
+
+    def finish(self):
+        if self._buffer:
+            raise ValueError("Compressed body ended mid-block")
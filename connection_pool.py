@@ -0,0 +1,168 @@
+"""
+Long-lived QUIC connections for the Flask API in client.py.
+
+Flask handlers are synchronous, so a single background thread runs an asyncio
+loop that owns every connection. Handlers submit coroutines to it with
+run_quic(); commands then open a new stream on a pooled connection instead of
+paying for a fresh event loop, configuration and TLS handshake each time.
+
+When a pooled connection has to be replaced, the session ticket from the
+previous one resumes the TLS session and the connection is handed out
+before the handshake finishes, so the first command rides in 0-RTT data.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from aioquic.asyncio import connect
+import udpio
+from profiles import effective_parameters
+
+POOL_IDLE_TIMEOUT = 30.0  # Close connections unused for this long (below the 60s QUIC idle timeout)
+POOL_REAP_INTERVAL = 5.0  # How often idle connections are checked
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """Return the background event loop, starting its thread on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="quic-loop", daemon=True)
+            thread.start()
+    return _loop
+
+
+def run_quic(coro, timeout=None):
+    """Run a coroutine on the background loop and block until it finishes"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+class PooledConnection:
+    """A connected protocol plus the bookkeeping needed for idle eviction"""
+    def __init__(self, context, protocol):
+        self.context = context
+        self.protocol = protocol
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def is_closed(self):
+        return self.protocol._closed.is_set()
+
+
+class ConnectionPool:
+    """
+    QUIC connections keyed by (host, port, lane), shared by all commands.
+    Must only be used from the background loop (see run_quic).
+    """
+    def __init__(self, create_protocol, idle_timeout=POOL_IDLE_TIMEOUT):
+        self._create_protocol = create_protocol
+        self._idle_timeout = idle_timeout
+        self._connections = {}
+        self._tickets = {}
+        self._locks = {}
+        self._reaper = None
+
+    @asynccontextmanager
+    async def connection(self, host, port, configuration, lane=0):
+        """
+        Yield a connected protocol for (host, port), reconnecting if the pooled
+        one has closed. A command that fails with a connection error or
+        timeout retires the connection so the next caller gets a fresh one.
+        Distinct lanes get separate connections to the same peer.
+        """
+        key = (host, port, lane)
+        entry = await self._acquire(key, configuration)
+        entry.in_flight += 1
+        try:
+            yield entry.protocol
+        except (ConnectionError, asyncio.TimeoutError):
+            # Stop handing this connection out; it is closed once other
+            # commands still using it have finished
+            if self._connections.get(key) is entry:
+                del self._connections[key]
+            raise
+        finally:
+            entry.in_flight -= 1
+            entry.last_used = time.monotonic()
+            if entry.in_flight == 0 and self._connections.get(key) is not entry:
+                await self._evict(key, entry)
+
+    async def close_all(self):
+        """Close every pooled connection"""
+        for key, entry in list(self._connections.items()):
+            await self._evict(key, entry)
+
+    def stats(self):
+        """Describe pooled connections, for diagnostics"""
+        now = time.monotonic()
+        return [
+            {
+                "host": host,
+                "port": port,
+                "lane": lane,
+                "in_flight": entry.in_flight,
+                "idle_seconds": round(now - entry.last_used, 1),
+                "closed": entry.is_closed,
+                "transport": effective_parameters(entry.protocol._quic),
+            }
+            for (host, port, lane), entry in self._connections.items()
+        ]
+
+    async def _acquire(self, key, configuration):
+        host, port, _ = key
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._connections.get(key)
+            if entry is not None and not entry.is_closed:
+                return entry
+            if entry is not None:
+                print(f"[POOL] Connection to {host}:{port} closed, reconnecting")
+                await self._evict(key, entry)
+
+            # Tickets are single use: the server forgets one once it is resumed
+            ticket = self._tickets.pop((host, port), None)
+            if ticket is not None and ticket.is_valid:
+                configuration.session_ticket = ticket
+
+            def remember_ticket(new_ticket):
+                self._tickets[(host, port)] = new_ticket
+
+            # UDP_FASTPATH batches datagrams with GSO/GRO (see udpio.py)
+            open_connection = udpio.connect if udpio.fastpath_enabled() else connect
+            context = open_connection(
+                host, port, configuration=configuration, create_protocol=self._create_protocol,
+                session_ticket_handler=remember_ticket,
+                # With a ticket, don't wait: commands go out as 0-RTT data
+                wait_connected=configuration.session_ticket is None,
+            )
+            protocol = await context.__aenter__()
+            entry = PooledConnection(context, protocol)
+            self._connections[key] = entry
+            resumed = " (resuming session)" if configuration.session_ticket is not None else ""
+            print(f"[POOL] Connected to {host}:{port}{resumed} ({len(self._connections)} pooled)")
+
+            if self._reaper is None or self._reaper.done():
+                self._reaper = asyncio.get_running_loop().create_task(self._reap_idle())
+            return entry
+
+    async def _evict(self, key, entry):
+        if self._connections.get(key) is entry:
+            del self._connections[key]
+        try:
+            await entry.context.__aexit__(None, None, None)
+        except Exception as e:
+            print(f"[POOL] Error closing connection to {key[0]}:{key[1]}: {e}")
+
+    async def _reap_idle(self):
+        while self._connections:
+            await asyncio.sleep(POOL_REAP_INTERVAL)
+            now = time.monotonic()
+            for key, entry in list(self._connections.items()):
+                if entry.is_closed or (entry.in_flight == 0 and now - entry.last_used > self._idle_timeout):
+                    print(f"[POOL] Evicting idle connection to {key[0]}:{key[1]}")
+                    await self._evict(key, entry)
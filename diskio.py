@@ -0,0 +1,220 @@
+"""
+Blocking file operations for the QUIC server, run off the event loop.
+
+A slow disk (or NFS mount) must not stall the loop that acknowledges
+packets and runs timers for every connection, so writes, reads, syncs and
+metadata operations go to a small thread pool instead. Interactive
+operations (creating and deleting files, opening and reading small ones)
+have a pool of their own, so they never queue behind the writes of a
+large transfer.
+
+Received files are written by SequentialWriter: the file is preallocated
+to its announced size, small network chunks are coalesced into large
+WRITE_ALIGN-multiple writev() calls, and DURABILITY in .env decides when
+data is synced:
+
+    none            leave it to the OS (fastest; a crash can lose recent files)
+    fsync-on-close  fsync each file, and its directory after the rename
+    periodic        fsync-on-close, plus an fdatasync every SYNC_BYTES written
+"""
+import asyncio
+import collections
+import errno
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+DISK_WORKERS = 8  # Threads doing file I/O
+INTERACTIVE_WORKERS = 2  # Threads reserved for interactive operations
+WRITE_ALIGN = 1024 * 1024  # Writes are issued in multiples of this size; only the tail is shorter
+IOV_MAX = 1024  # Buffers per writev() call
+SYNC_BYTES = 32 * 1024 * 1024  # With DURABILITY=periodic, bytes written between fdatasync() calls
+DURABILITY_MODES = ("none", "fsync-on-close", "periodic")
+
+
+class DiskExecutor:
+    """
+    Bounded thread pools for file I/O with per-file ordering: operations
+    submitted under the same key (normally the file path) run one at a
+    time in submission order, operations on different keys in parallel.
+    Interactive operations run on their own pool but still wait for
+    earlier operations on the same key.
+    """
+    def __init__(self, workers=DISK_WORKERS, interactive_workers=INTERACTIVE_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="disk-io")
+        self._interactive_pool = ThreadPoolExecutor(max_workers=interactive_workers,
+                                                    thread_name_prefix="disk-io-interactive")
+        self._queues = {}
+
+    def submit(self, key, fn, *args, interactive=False):
+        """
+        Queue fn(*args) behind earlier operations on key. Must be called
+        from the event loop; returns an asyncio future for the result.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pool = self._interactive_pool if interactive else self._pool
+        queue = self._queues.get(key)
+        if queue is None:
+            self._queues[key] = collections.deque()
+            self._start(loop, key, pool, fn, args, future)
+        else:
+            queue.append((pool, fn, args, future))
+        return future
+
+    def pending(self):
+        """Number of keys with operations queued or running"""
+        return len(self._queues)
+
+    def _start(self, loop, key, pool, fn, args, future):
+        work = loop.run_in_executor(pool, fn, *args)
+        work.add_done_callback(lambda done: self._finished(loop, key, done, future))
+
+    def _finished(self, loop, key, work, future):
+        if not future.done():
+            if work.exception() is not None:
+                future.set_exception(work.exception())
+            else:
+                future.set_result(work.result())
+
+        queue = self._queues[key]
+        if queue:
+            pool, fn, args, next_future = queue.popleft()
+            self._start(loop, key, pool, fn, args, next_future)
+        else:
+            del self._queues[key]
+
+
+def durability_mode():
+    """The DURABILITY setting (see load_env_vars); unknown values mean "none" """
+    mode = os.getenv("DURABILITY", "") or "none"
+    return mode if mode in DURABILITY_MODES else "none"
+
+
+def sync_data(fd):
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+def sync_directory(path):
+    """fsync a directory so a rename in it survives a crash (no-op where unsupported)"""
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class SequentialWriter:
+    """
+    Append-only writer for a file being received. Blocking; run it on the
+    disk executor. Buffers passed to write() are kept until written, so
+    they must not be modified afterwards.
+    """
+    def __init__(self, path, size=None, mode=0o666):
+        self.path = path
+        self.durability = durability_mode()
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        self.written = 0
+        self._pending = collections.deque()
+        self._pending_bytes = 0
+        self._unsynced = 0
+        if isinstance(size, int) and size > 0 and hasattr(os, "posix_fallocate"):
+            try:
+                # One extent up front instead of growing the file chunk by chunk
+                os.posix_fallocate(self.fd, 0, size)
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                    os.close(self.fd)
+                    raise
+
+    def write(self, data):
+        if not data:
+            return
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        if self._pending_bytes >= WRITE_ALIGN:
+            self._drain(self._pending_bytes - self._pending_bytes % WRITE_ALIGN)
+
+    @property
+    def pending_bytes(self):
+        """Bytes accepted by write() but held back until they fill a WRITE_ALIGN block"""
+        return self._pending_bytes
+
+    def flush(self):
+        """Write out everything held back, aligned or not (used when memory runs short)"""
+        self._drain(self._pending_bytes)
+
+    def _drain(self, size):
+        """Write the first size pending bytes with as few writev() calls as possible"""
+        while size:
+            buffers = []
+            take = 0
+            while self._pending and take < size and len(buffers) < IOV_MAX:
+                data = self._pending[0]
+                if take + len(data) <= size:
+                    buffers.append(data)
+                    take += len(data)
+                    self._pending.popleft()
+                else:
+                    cut = size - take
+                    view = memoryview(data)
+                    buffers.append(view[:cut])
+                    self._pending[0] = view[cut:]
+                    take += cut
+            done = 0
+            while done < take:
+                done += _write_buffers(self.fd, _skip(buffers, done))
+            self._pending_bytes -= take
+            self.written += take
+            self._unsynced += take
+            size -= take
+        if self.durability == "periodic" and self._unsynced >= SYNC_BYTES:
+            sync_data(self.fd)
+            self._unsynced = 0
+
+    def close(self):
+        """Write what is left, trim the preallocation to what was written and sync as configured"""
+        try:
+            self._drain(self._pending_bytes)
+            os.ftruncate(self.fd, self.written)
+            if self.durability != "none":
+                os.fsync(self.fd)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    def abort(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self._pending.clear()
+
+    def commit(self, target_path):
+        """Atomically move the finished file over target_path"""
+        os.replace(self.path, target_path)
+        if self.durability != "none":
+            sync_directory(os.path.dirname(target_path))
+
+
+def _write_buffers(fd, buffers):
+    if hasattr(os, "writev"):
+        return os.writev(fd, buffers)
+    return os.write(fd, b"".join(buffers))  # Windows has no writev()
+
+
+def _skip(buffers, count):
+    """buffers without their first count bytes"""
+    if not count:
+        return buffers
+    for index, data in enumerate(buffers):
+        if count < len(data):
+            return [memoryview(data)[count:]] + buffers[index + 1:]
+        count -= len(data)
+    return []
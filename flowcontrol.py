@@ -0,0 +1,138 @@
+"""
+Backpressure for QUIC streams.
+
+aioquic accepts any amount of data in send_stream_data() and simply grows the
+stream's send buffer. These helpers let a producer check how much it may queue
+right now (peer stream/connection credit plus a cap on unacknowledged bytes)
+and sleep until the connection makes progress.
+
+On the receive side aioquic hands data over as soon as it arrives and raises
+the peer's MAX_STREAM_DATA from what has arrived, not from what the
+application has consumed; pause_receiving() withholds that credit so a peer
+stops sending on a stream the application cannot keep up with.
+
+aioquic serves streams round robin, so a short command answer sent while
+a large transfer is in flight shares every packet with it. prioritize()
+gives a stream strict priority instead: while it has data it may send,
+other streams only fill the space it leaves in a packet.
+"""
+
+SEND_HIGH_WATER = 1024 * 1024  # Max unacknowledged bytes queued per stream
+
+
+def stream_send_credit(quic, stream_id):
+    """
+    Return how many bytes can be queued on a stream without overrunning the
+    peer's flow-control limits or the local send buffer cap.
+    """
+    stream = quic._streams.get(stream_id)
+    if stream is None:
+        return 0
+
+    sender = stream.sender
+    buffered = sender._buffer_stop - sender._buffer_start
+    unsent = sender._buffer_stop - sender.highest_offset
+
+    buffer_credit = SEND_HIGH_WATER - buffered
+    stream_credit = stream.max_stream_data_remote - sender._buffer_stop
+    connection_credit = quic._remote_max_data - quic._remote_max_data_used - unsent
+    return max(0, min(buffer_credit, stream_credit, connection_credit))
+
+
+class BackpressureMixin:
+    """
+    Mixin for QuicConnectionProtocol subclasses.
+    Every transmit() follows a received datagram or timer, which is when ACKs
+    and MAX_DATA/MAX_STREAM_DATA updates land, so it wakes waiting producers.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._send_waiters = []
+        self._paused_streams = set()
+        self._priority_streams = set()
+
+        # Skip stream credit updates for paused streams
+        write_stream_limits = self._quic._write_stream_limits
+
+        def _write_stream_limits(builder, space, stream):
+            if stream.stream_id not in self._paused_streams:
+                write_stream_limits(builder=builder, space=space, stream=stream)
+
+        self._quic._write_stream_limits = _write_stream_limits
+
+        # Hold back other streams while a priority stream can send
+        write_stream_frame = self._quic._write_stream_frame
+
+        def _write_stream_frame(builder, space, stream, max_offset):
+            if (self._priority_streams and stream.stream_id not in self._priority_streams
+                    and self._priority_pending()):
+                return 0
+            return write_stream_frame(builder=builder, space=space, stream=stream, max_offset=max_offset)
+
+        self._quic._write_stream_frame = _write_stream_frame
+
+    def transmit(self):
+        super().transmit()
+        if self._send_waiters:
+            waiters, self._send_waiters = self._send_waiters, []
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def wait_writable(self, stream_id, wanted):
+        """
+        Wait until at least `wanted` bytes of credit are available on the
+        stream (or any credit once its send buffer has fully drained).
+        Returns the available credit.
+        """
+        while True:
+            if self._closed.is_set():
+                raise ConnectionError("QUIC connection closed")
+
+            stream = self._quic._streams.get(stream_id)
+            if stream is None or stream.sender._reset_error_code is not None:
+                raise ConnectionError(f"QUIC stream {stream_id} is no longer writable")
+
+            credit = stream_send_credit(self._quic, stream_id)
+            if credit >= wanted:
+                return credit
+            if credit > 0 and stream.sender.buffer_is_empty:
+                return credit
+
+            waiter = self._loop.create_future()
+            self._send_waiters.append(waiter)
+            await waiter
+
+    def prioritize(self, stream_id):
+        """Send this stream's data ahead of every other stream's"""
+        self._priority_streams.add(stream_id)
+
+    def _priority_pending(self):
+        """Whether a priority stream has data that flow control lets it send now"""
+        quic = self._quic
+        for stream_id in list(self._priority_streams):
+            stream = quic._streams.get(stream_id)
+            if stream is None or stream.sender.is_finished:
+                self._priority_streams.discard(stream_id)
+                continue
+            sender = stream.sender
+            if sender.buffer_is_empty or stream.is_blocked or sender.reset_pending:
+                continue
+            if sender._pending_eof:
+                return True
+            if len(sender._pending):
+                limit = min(stream.max_stream_data_remote,
+                            sender.highest_offset + quic._remote_max_data - quic._remote_max_data_used)
+                if sender._pending[0].start < limit:
+                    return True
+        return False
+
+    def pause_receiving(self, stream_id):
+        """Stop granting the peer more credit on a stream"""
+        self._paused_streams.add(stream_id)
+
+    def resume_receiving(self, stream_id):
+        """Grant credit on a paused stream again"""
+        if stream_id in self._paused_streams:
+            self._paused_streams.discard(stream_id)
+            self.transmit()
@@ -0,0 +1,127 @@
+"""
+Binary command headers.
+
+A header is a fixed part followed by typed TLV fields:
+
+    "QF" | version (B) | command (B) | flags (H) | size (Q) | offset (Q) | checksum (I) | fields length (I)
+    then for each field: type (B) | length (H) | value
+
+The fixed part is enough to know the whole header length, so the receiver
+never scans for a delimiter. Unknown field types are skipped, which lets
+newer senders add fields; anything without a field type of its own rides in
+FIELD_EXTRA as a JSON object. decode_header returns the same dict as the
+JSON header line, which the server still accepts for older clients.
+"""
+import json
+import struct
+
+MAGIC = b"QF"
+VERSION = 1
+
+FIXED = struct.Struct(">2sBBHQQII")
+FIELD = struct.Struct(">BH")
+U64 = struct.Struct(">Q")
+
+FLAG_CHECKSUM = 0x1  # The checksum field carries a CRC32 of the data
+
+COMMANDS = (
+    "copy", "move", "create", "delete", "fetch", "stripe_begin", "range",
+    "stripe_commit", "signature", "delta", "hello", "status", "mkdir",
+    "pack",
+)
+COMMAND_CODES = {name: code for code, name in enumerate(COMMANDS, 1)}
+INTERACTIVE_COMMANDS = ("hello", "status", "create", "delete", "mkdir")  # Small request/response commands sent ahead of bulk data
+
+FIELD_SRC = 1
+FIELD_DEST = 2
+FIELD_TRANSFER_ID = 3
+FIELD_COMPRESSION = 4
+FIELD_BLOCK_SIZE = 5
+FIELD_EXTRA = 255
+
+TEXT_FIELDS = {FIELD_SRC: "src", FIELD_DEST: "dest", FIELD_TRANSFER_ID: "transfer_id",
+               FIELD_COMPRESSION: "compression"}
+INT_FIELDS = {FIELD_BLOCK_SIZE: "block_size"}
+_TEXT_TYPES = {name: field for field, name in TEXT_FIELDS.items()}
+_INT_TYPES = {name: field for field, name in INT_FIELDS.items()}
+_FIXED_KEYS = ("command", "size", "offset", "checksum")
+
+
+def encode_header(cmd):
+    """Encode a command header dict (as sent in JSON form) as a binary frame"""
+    code = COMMAND_CODES.get(cmd["command"])
+    if code is None:
+        raise ValueError(f"No binary code for command {cmd['command']!r}")
+
+    flags = 0
+    checksum = cmd.get("checksum")
+    if checksum is not None:
+        flags |= FLAG_CHECKSUM
+
+    fields = bytearray()
+    extra = {}
+    for key, value in cmd.items():
+        if key in _FIXED_KEYS or value is None or value == "":
+            continue
+        if key in _TEXT_TYPES and isinstance(value, str):
+            fields += _field(_TEXT_TYPES[key], value.encode("utf-8"))
+        elif key in _INT_TYPES and isinstance(value, int):
+            fields += _field(_INT_TYPES[key], U64.pack(value))
+        else:
+            extra[key] = value
+    if extra:
+        fields += _field(FIELD_EXTRA, json.dumps(extra).encode())
+
+    return FIXED.pack(MAGIC, VERSION, code, flags, cmd.get("size", 0), cmd.get("offset", 0),
+                      checksum or 0, len(fields)) + fields
+
+
+def _field(field_type, value):
+    if len(value) > 0xFFFF:
+        raise ValueError(f"Header field {field_type} too long ({len(value)} bytes)")
+    return FIELD.pack(field_type, len(value)) + value
+
+
+def header_length(buffer):
+    """
+    Total header length once the fixed part has arrived, else None.
+    Raises ValueError for anything that is not a supported frame.
+    """
+    if len(buffer) < FIXED.size:
+        return None
+    magic, version = bytes(buffer[:2]), buffer[2]
+    if magic != MAGIC:
+        raise ValueError("Not a binary header")
+    if version != VERSION:
+        raise ValueError(f"Unsupported header version {version}")
+    return FIXED.size + FIXED.unpack_from(buffer)[7]
+
+
+def decode_header(buffer):
+    """Decode a complete binary header into a command dict"""
+    _, _, code, flags, size, offset, checksum, length = FIXED.unpack_from(buffer)
+    if not 1 <= code <= len(COMMANDS):
+        raise ValueError(f"Unknown command code {code}")
+
+    cmd = {"command": COMMANDS[code - 1], "size": size, "offset": offset}
+    if flags & FLAG_CHECKSUM:
+        cmd["checksum"] = checksum
+
+    position = FIXED.size
+    end = FIXED.size + length
+    while position < end:
+        field_type, field_length = FIELD.unpack_from(buffer, position)
+        position += FIELD.size
+        value = bytes(buffer[position:position + field_length])
+        position += field_length
+        if position > end:
+            raise ValueError("Header field overruns the header")
+
+        if field_type in TEXT_FIELDS:
+            cmd[TEXT_FIELDS[field_type]] = value.decode("utf-8")
+        elif field_type in INT_FIELDS:
+            cmd[INT_FIELDS[field_type]] = U64.unpack(value)[0]
+        elif field_type == FIELD_EXTRA:
+            for key, extra_value in json.loads(value).items():
+                cmd.setdefault(key, extra_value)
+    return cmd
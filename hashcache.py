@@ -0,0 +1,159 @@
+"""
+Persistent cache of file digests.
+
+Comparing files between peers (delta signatures, chunk manifests, whole
+file checksums) keeps hashing the same unchanged files. Digests are stored
+in a SQLite database keyed by the file's (st_dev, st_ino, st_size,
+st_mtime_ns) and the kind of digest, so a file that is modified, replaced
+or truncated simply no longer matches its old entries; those are dropped
+when the file is next hashed. Lookups mark entries as used and the least
+recently used entries are evicted beyond HASH_CACHE_ENTRIES.
+
+server.py and client.py on one host share the database (SQLite handles
+the locking between processes). Set HASH_CACHE in .env to another path,
+or to "off" to disable the cache.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "quic-transfer", "hashes.db")
+HASH_CACHE_ENTRIES = 100000  # Entries kept before the least recently used are evicted
+EVICT_INTERVAL = 64  # Stores between eviction checks
+BUSY_TIMEOUT = 5.0  # Seconds to wait for another process holding the database lock
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (dev, ino, kind)
+);
+CREATE INDEX IF NOT EXISTS digests_used ON digests (used);
+"""
+
+
+class HashCache:
+    """SQLite-backed digest cache, safe to share between threads"""
+    def __init__(self, path, max_entries=HASH_CACHE_ENTRIES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stores = 0
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def get(self, st, kind):
+        """The cached value for a file's os.stat() result, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM digests WHERE dev = ? AND ino = ? AND kind = ? AND size = ? AND mtime_ns = ?",
+                (st.st_dev, st.st_ino, kind, st.st_size, st.st_mtime_ns)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE digests SET used = ? WHERE dev = ? AND ino = ? AND kind = ?",
+                             (time.time(), st.st_dev, st.st_ino, kind))
+            return bytes(row[0])
+
+    def put(self, st, kind, value):
+        """Store a value for a file, replacing whatever an older version of it had"""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (st.st_dev, st.st_ino, kind, st.st_size, st.st_mtime_ns, value, time.time()))
+            self._stores += 1
+            if self._stores % EVICT_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        count = self._db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute("DELETE FROM digests WHERE rowid IN "
+                             "(SELECT rowid FROM digests ORDER BY used LIMIT ?)", (count - self.max_entries,))
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM digests").fetchone()
+        return {"path": self.path, "entries": entries, "bytes": size, "max_entries": self.max_entries}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_cache = None
+_cache_pid = None
+_cache_failed = None  # (pid, path) that could not be opened, so it is not retried for every file
+_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """
+    This process's cache as configured by HASH_CACHE, or None when it is
+    off or cannot be opened. Reopened after a fork, since SQLite
+    connections must not cross processes. A path that failed to open is
+    not tried again by the same process.
+    """
+    global _cache, _cache_pid, _cache_failed
+    path = os.getenv("HASH_CACHE", "") or DEFAULT_PATH
+    if path.lower() in ("off", "none", "0"):
+        return None
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid() or _cache.path != path:
+            if _cache_failed == (os.getpid(), path):
+                return None
+            try:
+                _cache = HashCache(path)
+            except (OSError, sqlite3.Error) as e:
+                print(f"[!] Hash cache {path} unavailable: {e}")
+                _cache = None
+                _cache_failed = (os.getpid(), path)
+            _cache_pid = os.getpid()
+        return _cache
+
+
+def cached_digest(path, kind, compute, fd=None):
+    """
+    Return compute() for the file at path (or the open file fd), reusing
+    the value stored for this exact version of the file. A file that
+    changes while it is being hashed is not cached. Blocking.
+    """
+    cache = default_cache()
+    if cache is None:
+        return compute()
+
+    stat = (lambda: os.fstat(fd)) if fd is not None else (lambda: os.stat(path))
+    before = stat()
+    try:
+        value = cache.get(before, kind)
+    except sqlite3.Error as e:
+        print(f"[!] Hash cache lookup failed: {e}")
+        return compute()
+    if value is not None:
+        return value
+
+    value = compute()
+    after = stat()
+    if (after.st_dev, after.st_ino, after.st_size, after.st_mtime_ns) == \
+            (before.st_dev, before.st_ino, before.st_size, before.st_mtime_ns):
+        store(after, kind, value)
+    return value
+
+
+def store(st, kind, value):
+    """Record a digest computed elsewhere (e.g. while the file was received)"""
+    cache = default_cache()
+    if cache is None:
+        return
+    try:
+        cache.put(st, kind, value)
+    except sqlite3.Error as e:
+        print(f"[!] Hash cache update failed: {e}")
@@ -0,0 +1,84 @@
+"""
+End-to-end integrity digests for command bodies.
+
+A sender that sets "digest" in a command header hashes the body as it goes
+out and appends the DIGEST_SIZE-byte digest after the last body byte (after
+any compression, so it is never compressed). The receiver hashes the
+decoded body while writing it, holds back the final DIGEST_SIZE bytes of
+the stream, and compares them at the end; neither side makes a second
+pass over the data.
+
+BLAKE2b (hashlib) is always available; BLAKE3 and XXH3-128 are preferred
+when their packages (blake3, xxhash) are installed. All digests are
+truncated to DIGEST_SIZE bytes.
+"""
+import hashlib
+import os
+import time
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+DIGEST_SIZE = 16
+QUARANTINE_DIR = ".quarantine"  # Created next to a rejected file when INTEGRITY_MISMATCH=quarantine
+
+
+class _Blake3:
+    def __init__(self):
+        self._hasher = blake3.blake3()
+        self.update = self._hasher.update
+
+    def digest(self):
+        return self._hasher.digest(length=DIGEST_SIZE)
+
+
+def _hashes():
+    hashes = {}
+    if blake3 is not None:
+        hashes["blake3"] = _Blake3
+    if xxhash is not None:
+        hashes["xxh3_128"] = xxhash.xxh3_128
+    hashes["blake2b"] = lambda: hashlib.blake2b(digest_size=DIGEST_SIZE)
+    return hashes
+
+
+# name -> hasher factory, best first
+HASHES = _hashes()
+
+
+def available_hashes():
+    """Digest names supported by this process, best first"""
+    return list(HASHES)
+
+
+def choose_hash(offered):
+    """Pick the best digest from a peer's list that this process supports, or None"""
+    return next((name for name in HASHES if name in offered), None)
+
+
+def new_hasher(name):
+    """Object with update(data) and digest() -> DIGEST_SIZE bytes"""
+    return HASHES[name]()
+
+
+def mismatch_action():
+    """What to do with a file whose digest does not match: "reject" (delete) or "quarantine" """
+    action = os.getenv("INTEGRITY_MISMATCH", "") or "reject"
+    return action if action in ("reject", "quarantine") else "reject"
+
+
+def quarantine(path):
+    """Move a rejected file into QUARANTINE_DIR beside it; returns the new path"""
+    directory, name = os.path.split(path)
+    quarantine_dir = os.path.join(directory, QUARANTINE_DIR)
+    os.makedirs(quarantine_dir, exist_ok=True)
+    target = os.path.join(quarantine_dir, f"{name}.{time.time_ns()}")
+    os.replace(path, target)
+    return target
@@ -0,0 +1,188 @@
+"""
+Chunk manifests: per-chunk digests of a file and their Merkle root.
+
+A file is cut into chunk_size pieces (a power of two, so chunks line up
+with striped ranges) and each piece is hashed with one of the integrity.py
+digests. Chunks are hashed on a thread pool: hashlib, blake3 and xxhash
+release the GIL on large buffers and reads use os.pread, so building or
+checking a manifest keeps every core busy instead of one.
+
+The sender puts the manifest in the command header. The receiver checks
+the chunks once they are on disk and reports only the bad ones, which are
+sent again as ranges instead of resending the whole file. Manifests are
+kept in the resume sidecar, so a resumed transfer only rehashes chunks
+that arrived since the last check. The root, a binary hash tree over the
+chunk digests, identifies the whole file.
+
+Manifests of files on disk are kept in the hash cache (see hashcache.py):
+a file received with a verified manifest, or sent once, is not hashed
+again until it changes.
+"""
+import base64
+import os
+from concurrent.futures import ThreadPoolExecutor
+from byteranges import add_range
+from hashcache import cached_digest, store
+from integrity import DIGEST_SIZE, HASHES, new_hasher
+
+MIN_CHUNK_SIZE = 1024 * 1024  # Smallest chunk, and so the smallest piece ever resent
+MAX_CHUNKS = 1024  # Chunks per manifest, which keeps it small enough for a command header
+MANIFEST_THRESHOLD = 4 * 1024 * 1024  # Files at least this large are sent with a manifest
+READ_SIZE = 1024 * 1024  # Read size when hashing chunks of a file on disk
+HASH_WORKERS = os.cpu_count() or 4  # Threads hashing chunks
+
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="chunk-hash")
+
+
+def chunk_size_for(size):
+    """Smallest power-of-two chunk size (at least MIN_CHUNK_SIZE) giving at most MAX_CHUNKS chunks"""
+    chunk_size = MIN_CHUNK_SIZE
+    while chunk_size * MAX_CHUNKS < size:
+        chunk_size *= 2
+    return chunk_size
+
+
+def merkle_root(algorithm, digests):
+    """Root of a binary hash tree over chunk digests; an unpaired node moves up unchanged"""
+    if not digests:
+        return _digest(algorithm, b"")
+    level = list(digests)
+    while len(level) > 1:
+        paired = [_digest(algorithm, b"\x01" + level[i] + level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0]
+
+
+class Manifest:
+    """Digests of each chunk_size chunk of a size-byte file"""
+    def __init__(self, algorithm, chunk_size, size, digests):
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+        self.size = size
+        self.digests = digests
+        self._root = None
+
+    @property
+    def count(self):
+        return len(self.digests)
+
+    @property
+    def root(self):
+        if self._root is None:
+            self._root = merkle_root(self.algorithm, self.digests)
+        return self._root
+
+    def chunk_range(self, index):
+        start = index * self.chunk_size
+        return start, min(start + self.chunk_size, self.size)
+
+    def ranges(self, indices):
+        """Merged byte ranges covering the given chunks"""
+        ranges = []
+        for index in indices:
+            ranges = add_range(ranges, *self.chunk_range(index))
+        return ranges
+
+    def packed(self):
+        return b"".join(self.digests)
+
+    def to_header(self):
+        """The "manifest" header field"""
+        return {
+            "algorithm": self.algorithm,
+            "chunk_size": self.chunk_size,
+            "digests": base64.b64encode(self.packed()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_packed(cls, algorithm, chunk_size, size, packed):
+        """Manifest from concatenated chunk digests; raises ValueError if the count is wrong"""
+        count = -(-size // chunk_size)
+        if len(packed) != count * DIGEST_SIZE:
+            raise ValueError(f"{len(packed) // DIGEST_SIZE} chunk digests for {count} chunks")
+        digests = [packed[i:i + DIGEST_SIZE] for i in range(0, len(packed), DIGEST_SIZE)]
+        return cls(algorithm, chunk_size, size, digests)
+
+    @classmethod
+    def from_header(cls, fields, size):
+        """Parse a "manifest" header field for a size-byte file; raises ValueError if it is malformed"""
+        if not isinstance(fields, dict):
+            raise ValueError("manifest is not an object")
+        algorithm = fields.get("algorithm")
+        chunk_size = fields.get("chunk_size")
+        if algorithm not in HASHES:
+            raise ValueError(f"unsupported manifest digest {algorithm!r}")
+        if not isinstance(chunk_size, int) or chunk_size <= 0:
+            raise ValueError(f"invalid chunk size {chunk_size!r}")
+        if not isinstance(size, int) or size < 0:
+            raise ValueError(f"invalid file size {size!r}")
+        try:
+            packed = base64.b64decode(fields.get("digests", ""), validate=True)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"invalid chunk digests: {e}")
+        return cls.from_packed(algorithm, chunk_size, size, packed)
+
+
+def _cache_kind(algorithm, chunk_size):
+    return f"manifest:{algorithm}:{chunk_size}"
+
+
+def _digest(algorithm, data):
+    hasher = new_hasher(algorithm)
+    hasher.update(data)
+    return hasher.digest()
+
+
+def build_manifest(data, algorithm, chunk_size=None):
+    """Manifest of an in-memory buffer (e.g. a memoryview over an mmap), hashing chunks in parallel"""
+    size = len(data)
+    chunk_size = chunk_size or chunk_size_for(size)
+    view = memoryview(data)
+    chunks = (view[start:start + chunk_size] for start in range(0, size, chunk_size))
+    digests = list(_pool.map(lambda chunk: _digest(algorithm, chunk), chunks))
+    return Manifest(algorithm, chunk_size, size, digests)
+
+
+def file_manifest(data, algorithm, fd=None):
+    """
+    build_manifest() of a file's contents, reusing the hash cache entry of
+    the open file fd (the one data was read or mapped from) when given
+    """
+    chunk_size = chunk_size_for(len(data))
+    compute = lambda: build_manifest(data, algorithm, chunk_size).packed()
+    if fd is None:
+        packed = compute()
+    else:
+        packed = cached_digest(None, _cache_kind(algorithm, chunk_size), compute, fd=fd)
+    return Manifest.from_packed(algorithm, chunk_size, len(data), packed)
+
+
+def remember_manifest(path, manifest):
+    """Cache the manifest a received file was verified against, so sending it on needs no hashing"""
+    if manifest.chunk_size == chunk_size_for(manifest.size):
+        store(os.stat(path), _cache_kind(manifest.algorithm, manifest.chunk_size), manifest.packed())
+
+
+def _hash_file_chunk(fd, algorithm, start, stop):
+    hasher = new_hasher(algorithm)
+    while start < stop:
+        data = os.pread(fd, min(READ_SIZE, stop - start), start)
+        if not data:
+            break
+        hasher.update(data)
+        start += len(data)
+    return hasher.digest()
+
+
+def find_bad_chunks(fd, manifest, indices=None):
+    """
+    Hash chunks of an open file (all, or the given indices) in parallel
+    and return the indices whose digest differs from the manifest.
+    Blocking; run it on the disk executor.
+    """
+    indices = range(manifest.count) if indices is None else sorted(indices)
+    digests = _pool.map(lambda index: _hash_file_chunk(fd, manifest.algorithm, *manifest.chunk_range(index)),
+                        indices)
+    return [index for index, digest in zip(indices, digests) if digest != manifest.digests[index]]
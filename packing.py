@@ -0,0 +1,101 @@
+"""
+Packed small files.
+
+Sending a tree of tiny files one stream each pays for a stream, a header
+and a response round trip per file, which costs far more than the data.
+Files up to the pack threshold are instead sent many to a stream by the
+pack command, as back-to-back entries:
+
+    >HIQq (path length, mode, size, mtime in ns) + path + size bytes of data
+
+Paths are UTF-8, relative to the command's dest, with "/" separators.
+PackReader splits such a stream incrementally on the receiver; only entry
+headers are ever buffered.
+"""
+import os
+import struct
+
+DEFAULT_PACK_THRESHOLD = 64 * 1024  # Files up to this size are packed, when PACK_THRESHOLD_KB is not set
+PACK_BYTES = 4 * 1024 * 1024  # File data per pack stream
+PACK_ENTRIES = 1024  # Files per pack stream
+MAX_PATH_BYTES = 4096  # Longest entry path accepted
+
+ENTRY_HEADER = struct.Struct(">HIQq")
+
+
+def pack_threshold():
+    """PACK_THRESHOLD_KB from .env (see load_env_vars) in bytes; 0 turns packing off"""
+    value = os.getenv("PACK_THRESHOLD_KB", "")
+    try:
+        return int(float(value) * 1024) if value else DEFAULT_PACK_THRESHOLD
+    except ValueError:
+        raise ValueError(f"Invalid PACK_THRESHOLD_KB {value!r}")
+
+
+def entry_header(path, size, mode, mtime_ns):
+    """Header of one packed file"""
+    encoded = path.encode("utf-8")
+    if len(encoded) > MAX_PATH_BYTES:
+        raise ValueError(f"Path too long to pack: {path}")
+    return ENTRY_HEADER.pack(len(encoded), mode, size, mtime_ns) + encoded
+
+
+class PackReader:
+    """
+    Incrementally splits a pack stream. For each entry it calls
+    open_entry(path, size, mode, mtime_ns), which returns an object whose
+    write(data) receives the file's data and whose close() is called once
+    all of it has arrived.
+    """
+    def __init__(self, open_entry):
+        self.open_entry = open_entry
+        self.entries = 0
+        self._pending = bytearray()
+        self._path_length = None
+        self._header = None
+        self._current = None
+        self._left = 0
+
+    def feed(self, data):
+        data = memoryview(data)
+        while data:
+            if self._current is not None:
+                piece = data[:self._left]
+                self._current.write(piece)
+                self._left -= len(piece)
+                data = data[len(piece):]
+                if not self._left:
+                    self._finish_entry()
+                continue
+
+            needed = ENTRY_HEADER.size + (self._path_length or 0)
+            take = needed - len(self._pending)
+            self._pending += data[:take]
+            data = data[take:]
+            if len(self._pending) < needed:
+                return
+
+            if self._path_length is None:
+                self._header = ENTRY_HEADER.unpack_from(self._pending)
+                self._path_length = self._header[0]
+                if not 0 < self._path_length <= MAX_PATH_BYTES:
+                    raise ValueError(f"Invalid packed path length {self._path_length}")
+                continue
+
+            _, mode, size, mtime_ns = self._header
+            path = bytes(self._pending[ENTRY_HEADER.size:]).decode("utf-8")
+            self._pending = bytearray()
+            self._path_length = None
+            self._current = self.open_entry(path, size, mode, mtime_ns)
+            self._left = size
+            if not size:
+                self._finish_entry()
+
+    def finish(self):
+        if self._pending or self._current is not None:
+            raise ValueError("Pack stream ended mid-entry")
+
+    def _finish_entry(self):
+        current, self._current = self._current, None
+        current.close()
+        self.entries += 1
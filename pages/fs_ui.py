@@ -215,19 +215,45 @@ with col_actions:
         elif not st.session_state.selected_local_files:
             st.warning("No local files selected")
         else:
-            for src_path in list(st.session_state.selected_local_files):
-                # Construct destination path: remote_dir + filename
-                filename = os.path.basename(src_path)
-                dest_path = os.path.join(remote_dir, filename)
-                
-                data = {"src": src_path, "dest": dest_path}
-                result, error = call_api("transfer", data, LOCAL_API)
-                if error:
-                    st.error(f"❌ {filename}: {error}")
-                else:
-                    st.success(f"✅ Transferred {filename}")
+            # One batch request: the files share a QUIC connection and go concurrently
+            files = [
+                {"src": src_path, "dest": os.path.join(remote_dir, os.path.basename(src_path))}
+                for src_path in st.session_state.selected_local_files
+            ]
+            result, error = call_api("transfer_batch", {"files": files}, LOCAL_API)
+            if error:
+                st.error(f"❌ Transfer failed: {error}")
+            else:
+                for entry in result.get("files", []):
+                    filename = os.path.basename(entry["src"])
+                    if entry.get("status") == "success":
+                        st.success(f"✅ Transferred {filename}")
+                    else:
+                        st.error(f"❌ {filename}: {entry.get('error')}")
+                st.info(f"{result.get('bytes_transferred', 0)} bytes in {result.get('elapsed')}s "
+                        f"({result.get('throughput_mb_per_s')} MB/s)")
             st.session_state.selected_local_files = []
             st.rerun()
+
+    # Send the whole local folder being browsed, recursively
+    if st.button("📂 Send folder →", use_container_width=True, key="transfer_folder_to_remote"):
+        remote_dir = st.session_state.get("remote_path", "/")
+        local_dir = st.session_state.get("local_path", "")
+        folder = os.path.basename(local_dir.rstrip("/\\"))
+        if not remote_dir or not folder:
+            st.error("Pick a local folder other than the root and a remote path")
+        else:
+            data = {"src": local_dir, "dest": os.path.join(remote_dir, folder)}
+            result, error = call_api("transfer", data, LOCAL_API)
+            if error:
+                st.error(f"❌ {folder}: {error}")
+            else:
+                if result.get("status") == "error":
+                    st.error(f"❌ {folder}: no files transferred ({result.get('failed', 0)} failed)")
+                else:
+                    st.success(f"✅ {result.get('message')} ({result.get('failed', 0)} failed)")
+                for entry in result.get("errors", []):
+                    st.error(f"❌ {entry['src']}: {entry['error']}")
     st.divider()
 
     # Transfer Remote → Local (using transferremote)
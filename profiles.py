@@ -0,0 +1,114 @@
+"""
+Named QUIC transport profiles.
+
+aioquic's defaults (1MB connection and stream windows, 128 streams, Reno,
+1200-byte datagrams) suit web traffic. A profile sets flow-control windows,
+stream limits, idle timeout, congestion control, datagram size and cipher
+preference together; pick one with QUIC_PROFILE in .env on both server and
+client. Each side only controls what it advertises or sends, so both ends
+need the same profile to get its full effect; hello responses report the
+server's profile so a mismatch is visible.
+"""
+import os
+from dataclasses import dataclass
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.tls import CipherSuite
+
+DEFAULT_PROFILE = "default"
+
+PROFILES = {
+    # aioquic defaults
+    "default": {},
+    # Gigabit-class LANs: big windows so one connection can fill the link,
+    # CUBIC, larger packets, AES-GCM first (hardware accelerated on x86/ARMv8)
+    "lan-bulk": {
+        "max_data": 64 * 1024 * 1024,
+        "max_stream_data": 16 * 1024 * 1024,
+        "max_streams_bidi": 256,
+        "idle_timeout": 60.0,
+        "congestion_control_algorithm": "cubic",
+        "max_datagram_size": 1350,
+        "initial_rtt": 0.01,
+        "cipher_suites": [CipherSuite.AES_128_GCM_SHA256, CipherSuite.AES_256_GCM_SHA384,
+                          CipherSuite.CHACHA20_POLY1305_SHA256],
+    },
+    # Higher latency links: windows sized for ~50ms RTT, conservative packet size
+    "wan": {
+        "max_data": 32 * 1024 * 1024,
+        "max_stream_data": 8 * 1024 * 1024,
+        "max_streams_bidi": 128,
+        "idle_timeout": 120.0,
+        "congestion_control_algorithm": "cubic",
+        "max_datagram_size": 1200,
+        "initial_rtt": 0.1,
+    },
+    # Small boards: little receive buffering per connection, ChaCha20 first
+    # (fast without AES instructions)
+    "low-memory": {
+        "max_data": 512 * 1024,
+        "max_stream_data": 256 * 1024,
+        "max_streams_bidi": 16,
+        "idle_timeout": 30.0,
+        "congestion_control_algorithm": "reno",
+        "max_datagram_size": 1200,
+        "cipher_suites": [CipherSuite.CHACHA20_POLY1305_SHA256, CipherSuite.AES_128_GCM_SHA256],
+    },
+}
+
+
+@dataclass
+class ProfileConfiguration(QuicConfiguration):
+    """QuicConfiguration that remembers its profile and stream limit"""
+    profile: str = DEFAULT_PROFILE
+    max_streams_bidi: int = 128
+
+
+def active_profile():
+    """The profile named by QUIC_PROFILE (see load_env_vars), or the default"""
+    name = os.getenv("QUIC_PROFILE", "") or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown QUIC_PROFILE {name!r} (choose from {', '.join(PROFILES)})")
+    return name
+
+
+def quic_configuration(profile=None, **kwargs):
+    """Build a configuration from a profile (default: the active one); kwargs override it"""
+    profile = profile or active_profile()
+    settings = dict(PROFILES[profile])
+    settings.update(kwargs)
+    return ProfileConfiguration(profile=profile, **settings)
+
+
+def apply_connection_limits(quic):
+    """Apply the profile settings QuicConfiguration has no field for; call before connecting"""
+    limit = getattr(quic.configuration, "max_streams_bidi", None)
+    if limit is not None:
+        # Advertised in the transport parameters, so no MAX_STREAMS frame is due for it
+        quic._local_max_streams_bidi.value = limit
+        quic._local_max_streams_bidi.sent = limit
+
+
+def effective_parameters(quic):
+    """The transport parameters in force on a connection, local and as advertised by the peer"""
+    configuration = quic.configuration
+    key_schedule = getattr(getattr(quic, "tls", None), "key_schedule", None)
+    return {
+        "profile": getattr(configuration, "profile", DEFAULT_PROFILE),
+        "congestion_control": configuration.congestion_control_algorithm,
+        "cipher_suite": key_schedule.cipher_suite.name if key_schedule else None,
+        "max_datagram_size": quic._max_datagram_size,
+        "idle_timeout": quic._idle_timeout(),
+        "local": {
+            "max_data": quic._local_max_data.value,
+            "max_stream_data": quic._local_max_stream_data_bidi_remote,
+            "max_streams_bidi": quic._local_max_streams_bidi.value,
+        },
+        "peer": {
+            "max_data": quic._remote_max_data,
+            "max_stream_data": quic._remote_max_stream_data_bidi_remote,
+            "max_streams_bidi": quic._remote_max_streams_bidi,
+            "idle_timeout": quic._remote_max_idle_timeout,
+        },
+        "congestion_window": quic._loss.congestion_window,
+        "smoothed_rtt": round(quic._loss._rtt_smoothed, 6),
+    }
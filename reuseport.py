@@ -0,0 +1,127 @@
+"""
+UDP sockets shared by several server processes with SO_REUSEPORT.
+
+The kernel spreads datagrams over a reuseport group by a hash of the
+4-tuple, which would send a connection's packets to the wrong process as
+soon as the client's address or port changes. Instead every worker tags the
+connection IDs it issues with its index in the first byte, and a classic
+BPF program attached to the group picks the socket from that byte:
+
+    short header packets         -> first byte of the destination CID
+    long header Handshake/Retry  -> first byte of the destination CID
+    long header Initial/0-RTT    -> source address modulo the worker count
+
+Initial and 0-RTT packets still carry the destination CID the client made
+up, so they go by source address, which also keeps every connection from
+one client host (e.g. the lanes of a striped copy) on the same worker.
+Indices the group does not have fall back to the kernel hash.
+"""
+import ctypes
+import socket
+
+SO_ATTACH_REUSEPORT_CBPF = 51  # Linux, not exported by the socket module
+SKF_NET_OFF = -0x100000  # BPF load offset relative to the network header
+
+# Classic BPF opcodes
+_LD_B_ABS = 0x30
+_LD_W_ABS = 0x20
+_JSET_K = 0x45
+_JGE_K = 0x35
+_AND_K = 0x54
+_MOD_K = 0x94
+_RET_A = 0x16
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [("code", ctypes.c_ushort), ("jt", ctypes.c_ubyte),
+                ("jf", ctypes.c_ubyte), ("k", ctypes.c_uint32)]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_ushort), ("filter", ctypes.POINTER(_SockFilter))]
+
+
+def steering_program(workers, family=socket.AF_INET):
+    """The BPF instructions (code, jt, jf, k) selecting a worker socket"""
+    # Last 32 bits of the source address
+    source_offset = 12 if family == socket.AF_INET else 20
+    return [
+        (_LD_B_ABS, 0, 0, 0),            # A = first byte
+        (_JSET_K, 2, 0, 0x80),           # long header?
+        (_LD_B_ABS, 0, 0, 1),            # short: A = DCID[0]
+        (_RET_A, 0, 0, 0),
+        (_AND_K, 0, 0, 0x30),            # long: A = packet type
+        (_JGE_K, 0, 2, 0x20),            # Handshake or Retry?
+        (_LD_B_ABS, 0, 0, 6),            # A = DCID[0]
+        (_RET_A, 0, 0, 0),
+        (_LD_W_ABS, 0, 0, (SKF_NET_OFF + source_offset) & 0xFFFFFFFF),
+        (_MOD_K, 0, 0, workers),         # Initial/0-RTT: source address % workers
+        (_RET_A, 0, 0, 0),
+    ]
+
+
+def attach_steering(sock, workers):
+    """Attach the steering program to sock's reuseport group (Linux only)"""
+    program = steering_program(workers, sock.family)
+    filters = (_SockFilter * len(program))(*(_SockFilter(*insn) for insn in program))
+    fprog = _SockFprog(len(program), ctypes.cast(filters, ctypes.POINTER(_SockFilter)))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, bytes(fprog))
+
+
+def reuseport_sockets(host, port, count):
+    """
+    Bind count UDP sockets to one address as a reuseport group, in order,
+    so socket i is group index i. Returns (sockets, steered): steered is
+    False when the BPF program could not be attached and the kernel hash
+    picks the socket instead.
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise OSError("SO_REUSEPORT is not supported on this platform")
+
+    family, _, _, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+    sockets = []
+    try:
+        for _ in range(count):
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sockets.append(sock)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            if family == socket.AF_INET6:
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+            sock.bind(address)
+    except OSError:
+        for sock in sockets:
+            sock.close()
+        raise
+
+    try:
+        attach_steering(sockets[0], count)
+        steered = True
+    except OSError as e:
+        print(f"[!] Connection ID steering unavailable ({e}), using the kernel's address hash")
+        steered = False
+    return sockets, steered
+
+
+def tag_connection_ids(quic, index):
+    """
+    Make every connection ID `quic` issues start with the byte `index`.
+    Must run before the connection is registered with the server, i.e.
+    while its protocol is being created.
+    """
+    def tag(cid):
+        return bytes([index]) + cid[1:]
+
+    first = quic._host_cids[0]
+    first.cid = tag(first.cid)
+    quic.host_cid = first.cid
+    quic._local_initial_source_connection_id = first.cid
+
+    replenish = quic._replenish_connection_ids
+
+    def _replenish_connection_ids():
+        replenish()
+        for connection_id in quic._host_cids:
+            if not connection_id.was_sent:
+                connection_id.cid = tag(connection_id.cid)
+
+    quic._replenish_connection_ids = _replenish_connection_ids
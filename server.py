@@ -1,11 +1,34 @@
+import argparse
 import asyncio
+import collections
+import multiprocessing
+import multiprocessing.connection
 import os
 import json
+import stat
+import time
+import uuid
+import zlib
+from functools import partial
 from aioquic.asyncio import serve
 from aioquic.asyncio.protocol import QuicConnectionProtocol
-from aioquic.quic.events import StreamDataReceived
-from aioquic.quic.configuration import QuicConfiguration
+from aioquic.asyncio.server import QuicServer
+from aioquic.quic.events import ConnectionTerminated, HandshakeCompleted, StreamDataReceived, StreamReset
 from startsetup import load_env_vars
+from flowcontrol import BackpressureMixin
+from byteranges import add_range, covers, missing_ranges, remove_range
+from delta import DeltaReader, block_size_for, compute_signature
+from packing import PackReader
+from compression import CODECS, BlockDecoder, ChunkCompressor, available_codecs, choose_codec
+from framing import INTERACTIVE_COMMANDS, MAGIC, VERSION as FRAME_VERSION, decode_header, header_length
+from diskio import DiskExecutor, SequentialWriter, durability_mode, sync_data, sync_directory
+from budget import MemoryBudget, gate_connection, memory_budget_bytes
+from integrity import DIGEST_SIZE, HASHES, available_hashes, mismatch_action, new_hasher, quarantine
+from manifest import Manifest, find_bad_chunks, remember_manifest
+from hashcache import cached_digest
+from reuseport import reuseport_sockets, tag_connection_ids
+import udpio
+from profiles import active_profile, apply_connection_limits, effective_parameters, quic_configuration
 
 
 def _safe_path(path: str) -> str:
@@ -20,201 +43,1770 @@ def _safe_path(path: str) -> str:
     return normalized
 
 
-class FileReceiverProtocol(QuicConnectionProtocol):
-    def __init__(self, *args, **kwargs):
+def _relative_path(root, relative):
+    """Join a "/"-separated path sent relative to root, refusing anything that escapes it"""
+    if not isinstance(relative, str) or not relative:
+        raise ValueError(f"Invalid relative path: {relative!r}")
+    if relative.startswith(("/", "\\")) or os.path.isabs(relative):
+        raise ValueError(f"Not a relative path: {relative}")
+    _safe_path(relative)
+    return os.path.join(root, *relative.split("/"))
+
+
+HEADER_LIMIT = 64 * 1024  # Max bytes buffered while waiting for the header line
+CHUNK_SIZE = 64 * 1024  # Read size for fetch responses
+SMALL_FETCH = 1024 * 1024  # Fetches of files up to this size are handled as interactive commands
+STOP_ERROR_CODE = 1  # Application error code used for STOP_SENDING / RESET_STREAM
+
+
+VERIFY_BATCH = 8  # Chunks of a striped transfer hashed per disk operation when catching up with a manifest
+STRIPE_TIMEOUT = 3600  # Seconds before an idle striped transfer is closed (it stays resumable)
+STRIPE_REAP_INTERVAL = 60.0  # How often idle striped transfers are checked
+CHECKPOINT_INTERVAL = 1.0  # Min seconds between resume sidecar writes
+WRITE_BATCH = 256 * 1024  # Received data is handed to the disk executor in batches of this size
+WRITE_BACKLOG = 4 * 1024 * 1024  # Queued write bytes per stream before its flow-control credit is withheld
+WORKER_RESTART_DELAY = 1.0  # Min seconds between a worker starting and being restarted
+SESSION_TICKET_LIMIT = 10000  # Unused session tickets kept for resumption
+EARLY_DATA_COMMANDS = ("hello", "fetch", "signature", "status")  # Read-only commands run straight from 0-RTT data
+
+# Permission bits masked off new files; also applied to modes sent with a command
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+# All blocking file I/O runs here, ordered per file
+disk_io = DiskExecutor()
+
+# Received data held in memory by every connection of this process
+memory_budget = MemoryBudget(memory_budget_bytes())
+
+
+def _file_metadata(cmd):
+    """The sender's (mode, mtime_ns) from a command header, or None if it sent none"""
+    mode, mtime_ns = cmd.get("mode"), cmd.get("mtime_ns")
+    if not isinstance(mode, int) or not isinstance(mtime_ns, int):
+        return None
+    return mode, mtime_ns
+
+
+def _apply_metadata(path, metadata):
+    """Give a received file the sender's permission bits (less the umask) and mtime, as packed files get"""
+    if metadata is None:
+        return
+    mode, mtime_ns = metadata
+    os.chmod(path, (stat.S_IMODE(mode) & 0o777 or 0o666) & ~_UMASK)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def _log_io_error(future):
+    """Done callback for background file operations nobody waits on"""
+    if future.exception() is not None:
+        print(f"[!] Background file operation failed: {future.exception()}")
+
+
+class CorruptChunks(Exception):
+    """Chunks of a written file failed the manifest check; it was kept as a resumable transfer"""
+    def __init__(self, transfer_id, manifest, bad):
+        super().__init__(f"{len(bad)} corrupt chunk(s)")
+        self.transfer_id = transfer_id
+        self.ranges = manifest.ranges(bad)
+
+
+class FileSink:
+    """
+    Sequential writer for a plain copy/move target.
+    Sink methods do blocking I/O and run on the disk executor.
+    Data goes to a preallocated temporary file beside the target (see
+    SequentialWriter) that is renamed over it on close, so readers never
+    see a partial file. With a manifest, close() first checks the written
+    chunks (see manifest.py). metadata (see _file_metadata) is applied
+    before the rename.
+    """
+    def __init__(self, target_path, manifest=None, size=None, metadata=None):
+        self.target_path = target_path
+        self.temp_path = f"{target_path}.{uuid.uuid4().hex[:8]}.tmp"
+        self.manifest = manifest
+        self.size = size
+        self.metadata = metadata
+        self.writer = None
+
+    def open(self):
+        parent_dir = os.path.dirname(self.target_path)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        self.writer = SequentialWriter(self.temp_path, self.size)
+
+    def write(self, data):
+        self.writer.write(data)
+
+    def close(self):
+        self.writer.close()
+        if self.manifest is not None:
+            self._verify_chunks()
+        _apply_metadata(self.temp_path, self.metadata)
+        self.writer.commit(self.target_path)
+        if self.manifest is not None:
+            remember_manifest(self.target_path, self.manifest)
+
+    def _verify_chunks(self):
+        """
+        Check the written file against the sender's manifest. If chunks are
+        bad, the file becomes the .part of a striped transfer holding every
+        good chunk, so only the bad ones need sending again.
+        """
+        fd = os.open(self.temp_path, os.O_RDONLY)
+        try:
+            bad = find_bad_chunks(fd, self.manifest)
+            if bad:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        if bad:
+            transfer_id = StripedTarget.save_partial(self.temp_path, self.target_path, self.manifest, bad)
+            raise CorruptChunks(transfer_id, self.manifest, bad)
+
+    def abort(self):
+        """Discard the partially written temporary file"""
+        if self.writer is None:
+            return
+        self.writer.abort()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def reject(self, keep):
+        """Drop a file that failed verification, or quarantine it if keep; the target is left as it was"""
+        if not keep:
+            self.abort()
+            return
+        self.writer.close()
+        print(f"[!] Quarantined {self.target_path} as {quarantine(self.temp_path)}")
+
+
+class StripedTarget:
+    """
+    A file being received as offset-addressed ranges, possibly on several
+    streams. Data goes into a preallocated <dest>.part file that is renamed
+    over dest only once every byte has arrived.
+
+    Received ranges are checkpointed to a <dest>.part.json sidecar (after an
+    fdatasync of the data) so a transfer with the same transfer_id resumes
+    where it stopped, even across server restarts. The sidecar also keeps
+    the sender's chunk manifest, if any, and which chunks already passed
+    it, so a resumed transfer only checks what arrived since. Once the
+    manifest is known, each chunk is checked as soon as all of it has
+    arrived, which leaves stripe_commit little or nothing to hash.
+    """
+    def __init__(self, transfer_id, target_path, size):
+        self.transfer_id = transfer_id
+        self.target_path = target_path
+        self.part_path = target_path + ".part"
+        self.sidecar_path = self.part_path + ".json"
+        self.size = size
+        self.ranges = []
+        self.manifest = None
+        self.verified = set()
+        self.last_active = time.monotonic()
+        self.last_checkpoint = 0.0
+
+        if self._load_sidecar():
+            self.fd = os.open(self.part_path, os.O_RDWR)
+            return
+
+        self.fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if hasattr(os, "posix_fallocate") and size > 0:
+                os.posix_fallocate(self.fd, 0, size)
+            else:
+                os.ftruncate(self.fd, size)
+        except OSError:
+            os.ftruncate(self.fd, size)
+        self.checkpoint(force=True)
+
+    def _load_sidecar(self):
+        """Restore the checkpointed state if the .part on disk belongs to this transfer"""
+        try:
+            with open(self.sidecar_path, "r") as f:
+                saved = json.load(f)
+            if saved.get("transfer_id") != self.transfer_id or saved.get("size") != self.size:
+                return False
+            if os.path.getsize(self.part_path) != self.size:
+                return False
+            ranges = []
+            for start, stop in saved.get("ranges", []):
+                ranges = add_range(ranges, int(start), min(int(stop), self.size))
+            manifest = saved.get("manifest")
+            if manifest is not None:
+                self.manifest = Manifest.from_header(manifest, self.size)
+                self.verified = {int(index) for index in saved.get("verified", [])
+                                 if 0 <= int(index) < self.manifest.count}
+            self.ranges = ranges
+            return True
+        except (OSError, ValueError, TypeError):
+            return False
+
+    @staticmethod
+    def save_partial(written_path, target_path, manifest, bad):
+        """
+        Turn a completely written file with bad chunks into resume state:
+        move it to <dest>.part with a sidecar marking every other chunk as
+        received and verified. Returns the transfer_id to resume it with.
+        """
+        transfer_id = manifest.root.hex()[:32]
+        part_path = target_path + ".part"
+        ranges = [(0, manifest.size)]
+        for start, stop in manifest.ranges(bad):
+            ranges = remove_range(ranges, start, stop)
+        os.replace(written_path, part_path)
+        _write_sidecar(part_path + ".json", {
+            "transfer_id": transfer_id,
+            "size": manifest.size,
+            "ranges": ranges,
+            "manifest": manifest.to_header(),
+            "verified": sorted(set(range(manifest.count)) - set(bad)),
+        })
+        return transfer_id
+
+    @property
+    def received(self):
+        return sum(stop - start for start, stop in self.ranges)
+
+    def write_at(self, offset, data):
+        if offset + len(data) > self.size:
+            raise ValueError(f"Range write past end of file ({offset + len(data)} > {self.size})")
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, offset)
+            view = view[written:]
+            offset += written
+        self.last_active = time.monotonic()
+
+    def add_range(self, start, stop):
+        self.ranges = add_range(self.ranges, start, stop)
+        if self.manifest is not None:
+            first = start // self.manifest.chunk_size
+            last = -(-stop // self.manifest.chunk_size)
+            self._verify_received(self._unverified(range(first, min(last, self.manifest.count))))
+        self.checkpoint()
+
+    def missing(self):
+        return missing_ranges(self.ranges, self.size)
+
+    def checkpoint(self, force=False):
+        """
+        Persist the received ranges, at most once per CHECKPOINT_INTERVAL
+        unless forced. Data is synced first so the sidecar never claims
+        bytes that are not on disk.
+        """
+        now = time.monotonic()
+        if not force and now - self.last_checkpoint < CHECKPOINT_INTERVAL:
+            return
+        self.last_checkpoint = now
+
+        sync_data(self.fd)
+        _write_sidecar(self.sidecar_path, {
+            "transfer_id": self.transfer_id,
+            "size": self.size,
+            "ranges": self.ranges,
+            "manifest": self.manifest.to_header() if self.manifest is not None else None,
+            "verified": sorted(self.verified),
+        })
+
+    def use_manifest(self, manifest):
+        """Adopt the sender's manifest; chunks already received are left to verify_received()"""
+        if self.manifest is None or self.manifest.root != manifest.root or \
+                self.manifest.chunk_size != manifest.chunk_size:
+            self.manifest = manifest
+            self.verified = set()
+
+    def verify_received(self, limit=VERIFY_BATCH):
+        """Check up to limit chunks that have arrived but were not verified; returns whether more remain"""
+        if self.fd is None or self.manifest is None:
+            return False
+        complete = self._unverified(range(self.manifest.count))
+        self._verify_received(complete[:limit])
+        self.checkpoint()
+        return len(complete) > limit
+
+    def _unverified(self, indices):
+        """Those of the given chunks that have fully arrived and are not yet verified"""
+        return [index for index in indices
+                if index not in self.verified and covers(self.ranges, *self.manifest.chunk_range(index))]
+
+    def _verify_received(self, indices):
+        bad = self._check_chunks(indices)
+        if bad:
+            print(f"[!] Striped transfer {self.transfer_id}: {len(bad)} corrupt chunk(s), dropped for resending")
+
+    def _check_chunks(self, indices):
+        bad = find_bad_chunks(self.fd, self.manifest, indices) if indices else []
+        self.verified |= set(indices) - set(bad)
+        for start, stop in self.manifest.ranges(bad):
+            self.ranges = remove_range(self.ranges, start, stop)
+        return bad
+
+    def verify(self, manifest):
+        """
+        Check the chunks not yet verified against the sender's manifest.
+        Bad chunks are dropped from the received ranges so the sender
+        resends them; returns their indices.
+        """
+        if self.manifest is None or self.manifest.root != manifest.root or \
+                self.manifest.chunk_size != manifest.chunk_size:
+            self.manifest = manifest
+            self.verified = set()
+        bad = self._check_chunks(set(range(manifest.count)) - self.verified)
+        self.checkpoint(force=True)
+        return bad
+
+    def commit(self, metadata=None):
+        """Move the completed file into place (see _file_metadata for metadata) and drop the resume state"""
+        durable = durability_mode() != "none"
+        if durable:
+            os.fsync(self.fd)
+        os.close(self.fd)
+        self.fd = None
+        _apply_metadata(self.part_path, metadata)
+        os.replace(self.part_path, self.target_path)
+        if durable:
+            sync_directory(os.path.dirname(self.target_path))
+        try:
+            os.remove(self.sidecar_path)
+        except OSError:
+            pass
+        if self.manifest is not None and len(self.verified) == self.manifest.count:
+            remember_manifest(self.target_path, self.manifest)
+
+    def suspend(self):
+        """Checkpoint and close, keeping .part and sidecar for a later resume"""
+        if self.fd is not None:
+            self.checkpoint(force=True)
+            os.close(self.fd)
+            self.fd = None
+
+    def abort(self):
+        """Discard the transfer and its resume state"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        for path in (self.part_path, self.sidecar_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _write_sidecar(sidecar_path, saved):
+    """Atomically replace a resume sidecar"""
+    tmp_path = sidecar_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(saved, f)
+    os.replace(tmp_path, sidecar_path)
+
+
+class RangeSink:
+    """Writer for one range of a striped transfer, starting at offset"""
+    def __init__(self, striped, offset):
+        self.striped = striped
+        self.start = offset
+        self.offset = offset
+
+    def write(self, data):
+        self.striped.write_at(self.offset, data)
+        self.offset += len(data)
+
+    def close(self):
+        self.striped.add_range(self.start, self.offset)
+
+    def reject(self, keep):
+        # The range is not recorded as received, so it is sent again
+        pass
+
+    def abort(self):
+        # Stream data arrives in order, so what was written is a valid
+        # prefix of the range; keep it for resume
+        if self.striped.fd is not None and self.offset > self.start:
+            self.striped.ranges = add_range(self.striped.ranges, self.start, self.offset)
+            self.striped.checkpoint(force=True)
+
+
+class DeltaSink:
+    """
+    Applies a delta stream against the current target. The result is built
+    in a uniquely named <dest>.<id>.delta (the old file is still the basis
+    being read), so concurrent deltas to one target cannot clobber each
+    other, and replaces the target on close.
+    """
+    def __init__(self, target_path, block_size, size, metadata=None):
+        self.target_path = target_path
+        self.temp_path = f"{target_path}.{uuid.uuid4().hex[:8]}.delta"
+        self.block_size = block_size
+        self.size = size
+        self.metadata = metadata
+        self.out = None
+        self.reader = None
+
+    @property
+    def writer(self):
+        return self.out
+
+    def open(self):
+        self.out = SequentialWriter(self.temp_path, self.size)
+        self.reader = DeltaReader(self.target_path, self.block_size, self.out)
+        os.chmod(self.temp_path, stat.S_IMODE(os.fstat(self.reader.basis.fileno()).st_mode))
+
+    def write(self, data):
+        self.reader.feed(data)
+
+    def close(self):
+        self.reader.finish()
+        self.out.close()
+        if self.reader.output_bytes != self.size:
+            raise IOError(f"Delta rebuilt {self.reader.output_bytes} of {self.size} bytes")
+        _apply_metadata(self.temp_path, self.metadata)
+        self.out.commit(self.target_path)
+
+    def abort(self):
+        if self.reader is not None:
+            self.reader.close()
+        if self.out is None:
+            return
+        self.out.abort()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+    def reject(self, keep):
+        """Drop a rebuilt file that failed verification; the target is left as it was"""
+        if not keep:
+            self.abort()
+            return
+        self.reader.close()
+        self.out.close()
+        print(f"[!] Quarantined rebuilt {self.target_path} as {quarantine(self.temp_path)}")
+
+
+class PackSink:
+    """
+    Unpacks a pack stream (see packing.py) into files below root_path as
+    it arrives. Each file is written to a temporary name beside its target
+    with the sender's permission bits (less the umask) and mtime; all of
+    them are renamed into place on close, once the stream has passed its
+    integrity check.
+    """
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.reader = PackReader(self._open_entry)
+        self.finished = []
+        self.data_bytes = 0
+        self._current = None
+
+    @property
+    def writer(self):
+        """Writer of the file being unpacked, if any"""
+        return self._current.writer if self._current is not None else None
+
+    def open(self):
+        os.makedirs(self.root_path, exist_ok=True)
+
+    def write(self, data):
+        self.reader.feed(data)
+
+    def _open_entry(self, path, size, mode, mtime_ns):
+        target_path = _relative_path(self.root_path, path)
+        parent_dir = os.path.dirname(target_path)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        self._current = PackedFile(target_path, size, mode, mtime_ns)
+        self._current.on_close = self._entry_done
+        return self._current
+
+    def _entry_done(self, packed):
+        self._current = None
+        self.finished.append(packed)
+        self.data_bytes += packed.size
+
+    def close(self):
+        self.reader.finish()
+        for packed in self.finished:
+            packed.writer.commit(packed.target_path)
+
+    def _drop_current(self):
+        """Close the file cut off mid-entry; it is handled like the finished ones"""
+        if self._current is not None:
+            self._current.writer.abort()
+            self.finished.append(self._current)
+            self._current = None
+
+    def abort(self):
+        """Discard every file not yet renamed into place"""
+        self._drop_current()
+        for packed in self.finished:
+            try:
+                os.remove(packed.writer.path)
+            except OSError:
+                pass
+        self.finished = []
+
+    def reject(self, keep):
+        """Drop the files of a stream that failed verification, or quarantine them if keep"""
+        if not keep:
+            self.abort()
+            return
+        self._drop_current()
+        for packed in self.finished:
+            print(f"[!] Quarantined {packed.target_path} as {quarantine(packed.writer.path)}")
+        self.finished = []
+
+
+class PackedFile:
+    """One file of a pack stream, written to a temporary file until its PackSink closes"""
+    def __init__(self, target_path, size, mode, mtime_ns):
+        self.target_path = target_path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.writer = SequentialWriter(f"{target_path}.{uuid.uuid4().hex[:8]}.tmp", size,
+                                       mode=stat.S_IMODE(mode) & 0o777 or 0o666)
+        self.on_close = None
+
+    def write(self, data):
+        self.writer.write(data)
+
+    def close(self):
+        self.writer.close()
+        os.utime(self.writer.path, ns=(self.mtime_ns, self.mtime_ns))
+        self.on_close(self)
+
+
+# transfer_id -> StripedTarget, shared by every connection of this process
+_striped_transfers = {}
+
+# Open FileReceiverProtocol connections of this process
+_connections = set()
+
+# Task closing idle striped transfers while there are any
+_stripe_reaper = None
+
+
+def _expire_striped_transfers():
+    """Close striped transfers whose sender has gone quiet; their .part stays resumable"""
+    now = time.monotonic()
+    for transfer_id, striped in list(_striped_transfers.items()):
+        if now - striped.last_active > STRIPE_TIMEOUT:
+            print(f"[!] Striped transfer {transfer_id} to {striped.target_path} suspended after inactivity")
+            del _striped_transfers[transfer_id]
+            disk_io.submit(striped.part_path, striped.suspend).add_done_callback(_log_io_error)
+
+
+def _start_stripe_reaper():
+    """Expire idle striped transfers every STRIPE_REAP_INTERVAL until none are left"""
+    global _stripe_reaper
+    if _stripe_reaper is None or _stripe_reaper.done():
+        _stripe_reaper = asyncio.get_running_loop().create_task(_reap_striped_transfers())
+
+
+async def _reap_striped_transfers():
+    while _striped_transfers:
+        await asyncio.sleep(STRIPE_REAP_INTERVAL)
+        _expire_striped_transfers()
+
+
+def _write_to_sink(sink, data, drain):
+    """
+    Write a batch to a sink; with drain, its SequentialWriter (if any) also
+    writes out what it holds back for alignment. Returns the bytes the
+    writer still holds, which stay charged to the memory budget.
+    """
+    sink.write(data)
+    writer = getattr(sink, "writer", None)
+    if writer is None:
+        return 0
+    if drain:
+        writer.flush()
+    return writer.pending_bytes
+
+
+def _drain_all_streams():
+    """
+    The memory budget is exhausted: queue every stream's buffered bytes
+    for writing, held-back tails included. Paused streams get no more
+    data to complete their batches, so without this the budget could
+    never recover.
+    """
+    for connection in list(_connections):
+        for stream_id, state in list(connection._streams.items()):
+            if not state.pending_writes:
+                connection._flush_writes(stream_id, state, drain=True)
+
+
+def _use_manifest(striped, fields):
+    """
+    Give a striped transfer the manifest its stripe_begin or a range
+    carried, so chunks are verified as they arrive rather than all at
+    stripe_commit. Raises ValueError if the manifest is malformed.
+    """
+    manifest = Manifest.from_header(fields, striped.size)
+    disk_io.submit(striped.part_path, striped.use_manifest, manifest).add_done_callback(_log_io_error)
+    _verify_in_background(striped)
+
+
+def _verify_in_background(striped):
+    """
+    Check the chunks a striped transfer received before its manifest was
+    known, VERIFY_BATCH at a time, so range writes to the file interleave
+    with the hashing instead of waiting for all of it.
+    """
+    def step(done):
+        if done.exception() is not None:
+            _log_io_error(done)
+        elif done.result() and _striped_transfers.get(striped.transfer_id) is striped:
+            disk_io.submit(striped.part_path, striped.verify_received).add_done_callback(step)
+
+    disk_io.submit(striped.part_path, striped.verify_received).add_done_callback(step)
+
+
+def _open_striped(transfer_id, target_path, size):
+    parent_dir = os.path.dirname(target_path)
+    if parent_dir:
+        os.makedirs(parent_dir, exist_ok=True)
+    return StripedTarget(transfer_id, target_path, size)
+
+
+def _signature_of(target_path):
+    """Return (size, block size, signature) of an existing file, or None"""
+    if not os.path.isfile(target_path):
+        return None
+    file_size = os.path.getsize(target_path)
+    block_size = block_size_for(file_size)
+    signature = cached_digest(target_path, f"signature:{block_size}",
+                              lambda: compute_signature(target_path, block_size))
+    return file_size, block_size, signature
+
+
+def _open_for_read(source_path):
+    """Open a regular file for a fetch; returns (file, size)"""
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(f"File not found: {source_path}")
+    if not os.path.isfile(source_path):
+        raise IsADirectoryError(f"Not a file: {source_path}")
+    f = open(source_path, "rb")
+    return f, os.fstat(f.fileno()).st_size
+
+
+def _create_file(target_path):
+    parent_dir = os.path.dirname(target_path)
+    if parent_dir:
+        os.makedirs(parent_dir, exist_ok=True)
+    open(target_path, "w").close()
+
+
+def _make_dirs(root, paths):
+    """Create root and each of paths below it; returns how many were new"""
+    created = 0
+    for path in [root] + paths:
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+            created += 1
+    return created
+
+
+def _delete_file(target_path):
+    """Remove a file; returns False if it did not exist"""
+    try:
+        os.remove(target_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class SessionTicketStore:
+    """
+    TLS session tickets issued by this process, for resumption and 0-RTT.
+    A ticket is removed when a client resumes with it, so a replayed
+    ClientHello (and the 0-RTT data sent with it) is not accepted twice.
+    """
+    def __init__(self, limit=SESSION_TICKET_LIMIT):
+        self._tickets = collections.OrderedDict()
+        self._limit = limit
+
+    def add(self, ticket):
+        self._tickets[ticket.ticket] = ticket
+        while len(self._tickets) > self._limit:
+            self._tickets.popitem(last=False)
+
+    def pop(self, label):
+        ticket = self._tickets.pop(label, None)
+        if ticket is not None and not ticket.is_valid:
+            return None
+        return ticket
+
+
+session_tickets = SessionTicketStore()
+
+
+class StreamState:
+    """
+    Receive state for one stream.
+    Bytes are held only until the header has arrived; after that every
+    chunk is queued to the disk executor for the target, and the stream
+    is paused while more than WRITE_BACKLOG bytes are waiting or the
+    server's memory budget is exhausted. Buffered bytes are charged to
+    the budget until they are written, including those the sink's
+    SequentialWriter holds back for alignment (writer_held).
+    """
+    def __init__(self):
+        self.header = bytearray()
+        self.cmd = None
+        self.failed = False
+        self.sink = None
+        self.decoder = None
+        self.target_path = None
+        self.io_key = None
+        self.write_buffer = bytearray()
+        self.pending_writes = 0
+        self.writer_held = 0
+        self.paused = False
+        self.held = None
+        self.held_end = False
+        self.hasher = None
+        self.digest_tail = b""
+        self.bytes_written = 0
+        self.checksum = 0
+        self.started = time.monotonic()
+
+
+class FileReceiverProtocol(BackpressureMixin, QuicConnectionProtocol):
+    """
+    Handles one command per bidirectional stream.
+
+    Request:  header, then file data for copy/move, then FIN. The header is
+      a binary frame (see framing.py) or, for older clients, a JSON line;
+      the first byte tells them apart. hello reports the frame versions
+      and compression codecs the server supports.
+    Response: on the same stream, a JSON line followed by FIN:
+      {"status": "success", "command": ..., "bytes": N, "elapsed": s, "checksum": "crc32:..."}
+      {"status": "error", "command": ..., "error": "..."}
+    A fetch response is the {"status": "success", "src", "size"} line
+    followed by the file data.
+
+    Any command carrying data may set "compression" to a codec the server
+    listed in its hello response; the data is then a sequence of blocks
+    (see compression.py). A fetch may set "accept_compression" to a list
+    of codecs; the response line names the one used, if any.
+
+    A command with data may set "digest" to a hash the server listed in
+    its hello response; the data is then followed by the digest of the
+    (decoded) data, and a mismatch fails the command and removes or
+    quarantines what was written (see integrity.py).
+
+    Delta updates ask for the signature of dest (answered by the success
+    line, whose "bytes" is the signature length, then the signature), then
+    send delta (dest, size of the new file, block_size) with the delta
+    instructions as data; the response reports the rebuilt file.
+
+    pack carries many small files as its data (see packing.py), unpacked
+    below dest; the response reports how many in "files".
+
+    mkdir creates dest and the "dirs" below it, given as paths relative to
+    dest with "/" separators; recursive transfers send the directory tree
+    this way before the files.
+
+    Striped copies use stripe_begin (dest, size, transfer_id), which answers
+    with the byte ranges already received, then one range command per
+    stream (transfer_id, offset, data) for whatever is missing, then
+    stripe_commit once the sender has every range acknowledged.
+
+    A copy/move or stripe_commit may carry a "manifest" of chunk digests
+    (see manifest.py). The server checks the file against it; bad chunks
+    make the command fail with "missing" ranges to send again (for a copy,
+    as ranges of the striped transfer named by "transfer_id"), and success
+    responses report the manifest's "manifest_root". stripe_begin and
+    range may carry it too, once the sender has it; chunks are then
+    verified as they arrive, leaving stripe_commit little to check.
+
+    copy/move, delta and stripe_commit may carry the sender's "mode" and
+    "mtime_ns", which the file gets before it is moved into place.
+
+    Commands arriving in 0-RTT data before the handshake completes only
+    run straight away if they are read-only (EARLY_DATA_COMMANDS); others
+    are held until the handshake completes, so a replayed ClientHello can
+    never make them run.
+
+    With --workers, worker_index is the worker process serving the
+    connection; the connection IDs it issues are tagged with it so packets
+    are steered back to this process (see reuseport.py).
+
+    A peer may have at most its initial MAX_STREAMS (the profile's
+    max_streams_bidi) streams unfinished at once, and gets no more credit
+    while the memory budget is exhausted (see budget.py). The status
+    command reports the budget and stream counts.
+
+    INTERACTIVE_COMMANDS, and fetches of files up to SMALL_FETCH, are
+    answered ahead of bulk data: their streams get strict send priority
+    and their file operations run on the disk executor's interactive pool.
+    """
+    def __init__(self, *args, worker_index=None, **kwargs):
         super().__init__(*args, **kwargs)
+        apply_connection_limits(self._quic)
+        self._stream_cap = self._quic._local_max_streams_bidi.value
+        gate_connection(self._quic, memory_budget, self._stream_cap)
+        _connections.add(self)
+        if worker_index is not None:
+            tag_connection_ids(self._quic, worker_index)
         self._streams = {}
+        self._held_streams = []
+        self._tasks = set()
 
     def quic_event_received(self, event):
         if isinstance(event, StreamDataReceived):
             stream_id = event.stream_id
+            state = self._streams.get(stream_id)
+            if state is None:
+                state = self._streams[stream_id] = StreamState()
+
             data = event.data
+            if state.cmd is None and not state.failed:
+                data = self._consume_header(stream_id, state, data)
+
+            if state.held is not None:
+                state.held += data
+                memory_budget.charge(len(data))
+                state.held_end = event.end_stream
+                return
 
-            if stream_id not in self._streams:
-                self._streams[stream_id] = bytearray()
-            self._streams[stream_id].extend(data)
+            chunks = self._split_digest(state, data) if state.hasher is not None else (data,)
+            for chunk in chunks:
+                if chunk and state.sink is not None and not state.failed:
+                    self._receive_data(stream_id, state, chunk)
 
             if event.end_stream:
-                payload = self._streams.pop(stream_id)
-                
-                # Split header and file data
+                self._streams.pop(stream_id, None)
+                if state.decoder is not None and not state.failed:
+                    try:
+                        state.decoder.finish()
+                    except ValueError as e:
+                        self._fail(stream_id, state, f"Invalid compressed data: {e}")
+                if not state.failed:
+                    self._flush_writes(stream_id, state)
+                    # With a manifest, the chunk check finds what to resend instead
+                    if state.hasher is not None and state.digest_tail != state.hasher.digest() and \
+                            getattr(state.sink, "manifest", None) is None:
+                        self._reject_corrupt(stream_id, state)
+                    else:
+                        self._spawn(self._finish_command(stream_id, state))
+
+        elif isinstance(event, HandshakeCompleted):
+            self._release_held_streams()
+
+        elif isinstance(event, StreamReset):
+            state = self._streams.pop(event.stream_id, None)
+            if state is not None:
+                print(f"[!] Stream {event.stream_id} reset by peer")
+                self._abort_stream(state)
+
+        elif isinstance(event, ConnectionTerminated):
+            _connections.discard(self)
+            for state in self._streams.values():
+                self._abort_stream(state)
+            self._streams.clear()
+
+    def _receive_data(self, stream_id, state, data):
+        """Decode a chunk of body data, hash it and queue it for writing"""
+        try:
+            pieces = state.decoder.feed(data) if state.decoder else (data,)
+        except ValueError as e:
+            self._fail(stream_id, state, f"Invalid compressed data: {e}")
+            return
+        for piece in pieces:
+            state.bytes_written += len(piece)
+            state.checksum = zlib.crc32(piece, state.checksum)
+            if state.hasher is not None:
+                state.hasher.update(piece)
+            state.write_buffer += piece
+            memory_budget.charge(len(piece))
+        if len(state.write_buffer) >= WRITE_BATCH:
+            self._flush_writes(stream_id, state)
+        if memory_budget.exhausted:
+            _drain_all_streams()
+
+    @staticmethod
+    def _split_digest(state, data):
+        """
+        Hold back the last DIGEST_SIZE bytes seen on the stream (the digest
+        trailer once the stream ends); return the body chunks before them.
+        """
+        if len(data) >= DIGEST_SIZE:
+            chunks = (state.digest_tail, data[:len(data) - DIGEST_SIZE])
+            state.digest_tail = bytes(data[len(data) - DIGEST_SIZE:])
+            return chunks
+        joined = state.digest_tail + bytes(data)
+        cut = max(0, len(joined) - DIGEST_SIZE)
+        state.digest_tail = joined[cut:]
+        return (joined[:cut],)
+
+    def _reject_corrupt(self, stream_id, state):
+        """The body does not match the sender's digest: drop or quarantine what was written"""
+        action = mismatch_action()
+        error_msg = (f"Integrity check failed for {state.target_path or state.cmd.get('dest', '')}: "
+                     f"{state.cmd.get('digest')} digest mismatch "
+                     f"({'quarantined' if action == 'quarantine' else 'removed'})")
+        print(f"[!] {error_msg}")
+        state.failed = True
+        self._release_writer(state)
+        if state.sink is not None:
+            sink, state.sink = state.sink, None
+            disk_io.submit(state.io_key, sink.reject, action == "quarantine").add_done_callback(_log_io_error)
+        # Damage in transit: sending again may well succeed
+        self._send_response(stream_id, {"status": "error", "error": error_msg, "retryable": True})
+
+    def _consume_header(self, stream_id, state, data):
+        """
+        Buffer header bytes until the whole header has arrived, then parse
+        the command and open its target. Returns the file data that followed
+        the header in this chunk (possibly empty).
+        """
+        if (state.header or data)[:1] == MAGIC[:1]:
+            parsed = self._parse_binary_header(stream_id, state, data)
+        else:
+            parsed = self._parse_json_header(stream_id, state, data)
+        if parsed is None:
+            return b""
+        cmd, data = parsed
+
+        state.cmd = cmd
+        command = cmd.get("command", "copy")
+        print(f"[DEBUG] Command: {command}, src: {cmd.get('src', '')}, dest: {cmd.get('dest', '')}")
+        if command in INTERACTIVE_COMMANDS:
+            self.prioritize(stream_id)
+
+        if not self._quic._handshake_complete and command not in EARLY_DATA_COMMANDS:
+            # 0-RTT data can be replayed: wait until the client is proven live
+            state.held = bytearray(data)
+            memory_budget.charge(len(state.held))
+            self._held_streams.append((stream_id, state))
+            return b""
+        return self._start_command(stream_id, state, data)
+
+    def _release_held_streams(self):
+        """Start the commands held back while the handshake was incomplete"""
+        held, self._held_streams = self._held_streams, []
+        for stream_id, state in held:
+            if self._streams.get(stream_id) is not state:
+                continue
+            data, state.held = bytes(state.held), None
+            memory_budget.release(len(data))
+            data = self._start_command(stream_id, state, data)
+            self.quic_event_received(StreamDataReceived(data=data, end_stream=state.held_end, stream_id=stream_id))
+
+    def _start_command(self, stream_id, state, data):
+        """Open the target of a parsed command; returns data, or b"" after failing"""
+        cmd = state.cmd
+        command = cmd.get("command", "copy")
+        digest = cmd.get("digest")
+        if digest:
+            if digest not in HASHES:
+                self._fail(stream_id, state, f"Unsupported digest: {digest}")
+                return b""
+            state.hasher = new_hasher(digest)
+
+        codec = cmd.get("compression")
+        if codec:
+            if codec not in CODECS:
+                self._fail(stream_id, state, f"Unsupported compression: {codec}")
+                return b""
+            state.decoder = BlockDecoder(codec)
+
+        if command == "copy" or command == "move":
+            self._open_target(stream_id, state)
+        elif command == "range":
+            self._open_range(stream_id, state)
+        elif command == "delta":
+            self._open_delta(stream_id, state)
+        elif command == "pack":
+            self._open_pack(stream_id, state)
+        return data
+
+    def _parse_binary_header(self, stream_id, state, data):
+        """
+        Length-prefixed binary header (see framing.py). Returns (cmd, data
+        after the header), or None while incomplete or after failing.
+        """
+        buffer = data
+        if state.header:
+            state.header.extend(data)
+            buffer = state.header
+        try:
+            length = header_length(buffer)
+            if length is not None and length > HEADER_LIMIT:
+                raise ValueError(f"Header too long ({length} bytes)")
+            if length is None or len(buffer) < length:
+                if buffer is data:
+                    state.header.extend(data)
+                return None
+            cmd = decode_header(memoryview(buffer)[:length])
+        except Exception as e:
+            state.header = bytearray()
+            self._fail(stream_id, state, f"Invalid header: {e}")
+            return None
+
+        if buffer is data:
+            rest = memoryview(data)[length:]
+        else:
+            rest = bytes(buffer[length:])
+        state.header = bytearray()
+        return cmd, rest
+
+    def _parse_json_header(self, stream_id, state, data):
+        """
+        Compatibility form: a JSON line ended by a newline. Only the newly
+        arrived chunk is scanned for the delimiter. Returns (cmd, data after
+        the header), or None while incomplete or after failing.
+        """
+        header_end = data.find(b"\n")
+        if header_end < 0:
+            state.header.extend(data)
+            if len(state.header) > HEADER_LIMIT:
+                state.header = bytearray()
+                self._fail(stream_id, state, "No header delimiter found")
+            return None
+
+        state.header.extend(data[:header_end])
+        try:
+            cmd = json.loads(state.header.decode("utf-8"))
+            if not isinstance(cmd, dict):
+                raise ValueError("header is not a JSON object")
+        except Exception as e:
+            self._fail(stream_id, state, f"Invalid header: {e}")
+            return None
+        finally:
+            state.header = bytearray()
+        return cmd, memoryview(data)[header_end + 1:]
+
+    def _open_target(self, stream_id, state):
+        """Create the destination of a copy/move and open it for streaming writes"""
+        command = state.cmd.get("command", "copy")
+        dest = state.cmd.get("dest", "")
+        if not dest:
+            self._fail(stream_id, state, f"{command} requires 'dest' path")
+            return
+
+        try:
+            target_path = _safe_path(dest)
+        except ValueError as ve:
+            self._fail(stream_id, state, f"Path error: {ve}")
+            return
+
+        manifest = None
+        if state.cmd.get("manifest") is not None:
+            try:
+                manifest = Manifest.from_header(state.cmd["manifest"], state.cmd.get("size"))
+            except ValueError as e:
+                self._fail(stream_id, state, f"Invalid manifest: {e}")
+                return
+
+        # Opening (and creating the parent directory) is queued ahead of the writes
+        state.sink = FileSink(target_path, manifest, state.cmd.get("size"), _file_metadata(state.cmd))
+        state.target_path = state.io_key = target_path
+        self._queue_io(stream_id, state, state.sink.open)
+
+    def _open_range(self, stream_id, state):
+        """Point a range stream at its striped transfer and offset"""
+        striped = _striped_transfers.get(state.cmd.get("transfer_id"))
+        if striped is None:
+            self._fail(stream_id, state, f"Unknown striped transfer: {state.cmd.get('transfer_id')}")
+            return
+
+        offset = state.cmd.get("offset", 0)
+        if not isinstance(offset, int) or offset < 0 or offset > striped.size:
+            self._fail(stream_id, state, f"Invalid range offset: {offset}")
+            return
+        state.sink = RangeSink(striped, offset)
+        state.target_path = state.io_key = striped.part_path
+        if state.cmd.get("manifest") is not None:
+            try:
+                _use_manifest(striped, state.cmd["manifest"])
+            except ValueError as e:
+                self._fail(stream_id, state, f"Invalid manifest: {e}")
+
+    def _open_delta(self, stream_id, state):
+        """Start rebuilding an existing destination from a delta stream"""
+        block_size = state.cmd.get("block_size")
+        if not isinstance(block_size, int) or block_size <= 0:
+            self._fail(stream_id, state, f"Invalid delta block size: {block_size}")
+            return
+
+        try:
+            target_path = _safe_path(state.cmd.get("dest", ""))
+        except ValueError as ve:
+            self._fail(stream_id, state, f"Path error: {ve}")
+            return
+
+        state.sink = DeltaSink(target_path, block_size, state.cmd.get("size"), _file_metadata(state.cmd))
+        state.target_path = state.io_key = target_path
+        self._queue_io(stream_id, state, state.sink.open)
+
+    def _open_pack(self, stream_id, state):
+        """Start unpacking a stream of small files below dest"""
+        dest = state.cmd.get("dest", "")
+        if not dest:
+            self._fail(stream_id, state, "pack requires 'dest' path")
+            return
+        try:
+            root_path = _safe_path(dest)
+        except ValueError as ve:
+            self._fail(stream_id, state, f"Path error: {ve}")
+            return
+
+        state.sink = PackSink(root_path)
+        state.target_path = root_path
+        # Packs into the same directory write different files, so they need not queue behind each other
+        state.io_key = (root_path, id(state.sink))
+        self._queue_io(stream_id, state, state.sink.open)
+
+    def _flush_writes(self, stream_id, state, drain=False):
+        """
+        Queue the data buffered for a stream as one write. With drain (or
+        while the memory budget is exhausted) the sink's writer also writes
+        out what it holds back, so none of the stream's bytes stay in memory.
+        """
+        if state.sink is None or state.failed:
+            return
+        drain = drain or memory_budget.exhausted
+        if state.write_buffer or (drain and state.writer_held):
+            data, state.write_buffer = state.write_buffer, bytearray()
+            self._queue_io(stream_id, state, _write_to_sink, state.sink, data, drain, size=len(data),
+                           writes=True)
+
+    def _queue_io(self, stream_id, state, fn, *args, size=0, writes=False):
+        """
+        Run a sink operation on the disk executor without waiting for it; a
+        failure fails the stream. size counts towards the stream's write
+        backlog, and the peer is throttled while that is over WRITE_BACKLOG.
+        writes marks a _write_to_sink() call, whose result is the stream's
+        new writer_held.
+        """
+        state.pending_writes += size
+        future = disk_io.submit(state.io_key, fn, *args)
+        future.add_done_callback(lambda done: self._io_done(stream_id, state, size, done, writes))
+        self._update_pause(stream_id, state)
+
+    def _io_done(self, stream_id, state, size, future, writes=False):
+        state.pending_writes -= size
+        memory_budget.release(size)
+        error = future.exception()
+        if error is not None and not state.failed:
+            self._fail(stream_id, state, f"Write error on {state.target_path}: {error}")
+        elif writes and not state.failed:
+            held = future.result()
+            if held > state.writer_held:
+                memory_budget.charge(held - state.writer_held)
+            else:
+                memory_budget.release(state.writer_held - held)
+            state.writer_held = held
+            # Writes queued before the budget ran out may have left bytes behind
+            if memory_budget.exhausted:
+                _drain_all_streams()
+        self._update_pause(stream_id, state)
+
+    @staticmethod
+    def _release_writer(state):
+        """The sink is closed or dropped: what its writer held is no longer in memory"""
+        memory_budget.release(state.writer_held)
+        state.writer_held = 0
+
+    def _update_pause(self, stream_id, state):
+        """
+        Withhold the stream's credit while its write backlog is over
+        WRITE_BACKLOG or the memory budget is exhausted; grant it again
+        once the backlog is down to half and the budget has recovered.
+        """
+        if state.failed:
+            throttle = False
+        elif state.paused:
+            throttle = state.pending_writes > WRITE_BACKLOG // 2 or memory_budget.exhausted
+        else:
+            throttle = state.pending_writes > WRITE_BACKLOG or memory_budget.exhausted
+
+        if throttle and not state.paused:
+            state.paused = True
+            self.pause_receiving(stream_id)
+        elif not throttle and state.paused:
+            state.paused = False
+            self.resume_receiving(stream_id)
+        if throttle and memory_budget.exhausted:
+            memory_budget.when_available(self._budget_available)
+
+    def _budget_available(self):
+        """The memory budget recovered: re-check every paused stream and send the withheld credit"""
+        if self not in _connections:
+            return
+        for stream_id, state in list(self._streams.items()):
+            if state.paused:
+                self._update_pause(stream_id, state)
+        self.transmit()
+
+    def _spawn(self, coro):
+        """Run a coroutine for this connection, keeping a reference until it finishes"""
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _abort_stream(self, state):
+        """Drop an incomplete copy so no truncated file is left behind"""
+        state.failed = True
+        memory_budget.release(len(state.write_buffer))
+        state.write_buffer = bytearray()
+        self._release_writer(state)
+        if state.held is not None:
+            memory_budget.release(len(state.held))
+            state.held = None
+        if state.sink is not None:
+            sink, state.sink = state.sink, None
+            disk_io.submit(state.io_key, sink.abort).add_done_callback(_log_io_error)
+
+    def _fail(self, stream_id, state, error_msg):
+        """
+        Reject a command mid-stream: report the error, discard any partial
+        output and ask the peer to stop sending the rest of the data.
+        """
+        print(f"[!] {error_msg}")
+        self._abort_stream(state)
+        self._send_error_response(stream_id, error_msg)
+        if stream_id in self._streams:
+            try:
+                self._quic.stop_stream(stream_id, STOP_ERROR_CODE)
+                self.transmit()
+            except ValueError:
+                pass
+
+    async def _finish_command(self, stream_id, state):
+        """
+        Run a command once its stream has ended and reply on the same stream.
+        File operations are awaited on the disk executor; a write failure
+        reported meanwhile has already answered the stream.
+        """
+        if state.cmd is None:
+            print(f"[!] No header delimiter found")
+            self._send_error_response(stream_id, "No header delimiter found")
+            return
+
+        cmd = state.cmd
+        src = cmd.get("src", "")
+        command = cmd.get("command", "copy")
+
+        try:
+            if command == "copy" or command == "move":
+                sink = state.sink
                 try:
-                    header_end = payload.index(b"\n")
-                    header_bytes = payload[:header_end]
-                    filedata = payload[header_end + 1:]
-                except ValueError:
-                    print(f"[!] No header delimiter found")
+                    await disk_io.submit(state.io_key, sink.close)
+                except CorruptChunks as e:
+                    state.sink = None
+                    print(f"[!] {e} in {state.target_path}; kept as transfer {e.transfer_id} for repair")
+                    self._send_response(stream_id, {
+                        "status": "error",
+                        "error": f"{e} in {state.target_path}",
+                        "transfer_id": e.transfer_id,
+                        "missing": e.ranges,
+                        "retryable": True
+                    })
                     return
+                if state.failed:
+                    return
+                state.sink = None
+                print(f"[+] {command.capitalize()}d to {state.target_path} ({state.bytes_written} bytes)")
+                if sink.manifest is not None:
+                    self._send_success_response(stream_id, state, manifest_root=sink.manifest.root.hex())
+                else:
+                    self._send_success_response(stream_id, state)
 
-                try:
-                    cmd = json.loads(header_bytes.decode("utf-8", errors="ignore"))
-                except Exception as e:
-                    print(f"[!] Invalid header: {e}")
+            elif command == "hello":
+                self._send_response(stream_id, {
+                    "status": "success",
+                    "command": command,
+                    "codecs": available_codecs(),
+                    "frame_versions": [FRAME_VERSION],
+                    "hashes": available_hashes(),
+                    "profile": active_profile(),
+                    "transport": effective_parameters(self._quic),
+                })
+
+            elif command == "status":
+                self._send_response(stream_id, {
+                    "status": "success",
+                    "command": command,
+                    "memory": memory_budget.stats(),
+                    "connections": len(_connections),
+                    "streams": sum(len(connection._streams) for connection in _connections),
+                    "streams_per_connection": self._stream_cap,
+                    "striped_transfers": len(_striped_transfers),
+                    "disk_queue": disk_io.pending(),
+                })
+
+            elif command == "signature":
+                target_path = _safe_path(cmd.get("dest", ""))
+                signed = await disk_io.submit(target_path, _signature_of, target_path)
+                if signed is None:
+                    print(f"[!] No basis for delta: {target_path}")
+                    self._send_error_response(stream_id, f"File not found: {target_path}")
+                    return
+
+                file_size, block_size, signature = signed
+                response = json.dumps({
+                    "status": "success",
+                    "command": command,
+                    "size": file_size,
+                    "block_size": block_size,
+                    "bytes": len(signature)
+                }).encode()
+                self._quic.send_stream_data(stream_id, response + b"\n" + signature, end_stream=True)
+                self.transmit()
+                print(f"[+] Sent signature of {target_path} ({len(signature)} bytes)")
+
+            elif command == "delta":
+                sink = state.sink
+                await disk_io.submit(state.io_key, sink.close)
+                if state.failed:
+                    return
+                state.sink = None
+                print(f"[+] Delta applied to {state.target_path} "
+                      f"({state.bytes_written} bytes received, {sink.reader.output_bytes} bytes written)")
+                self._send_success_response(stream_id, state, bytes=sink.reader.output_bytes,
+                                            checksum=f"crc32:{sink.reader.output_checksum:08x}",
+                                            received=state.bytes_written)
+
+            elif command == "pack":
+                sink = state.sink
+                await disk_io.submit(state.io_key, sink.close)
+                if state.failed:
                     return
+                state.sink = None
+                print(f"[+] Unpacked {sink.reader.entries} file(s) into {state.target_path} "
+                      f"({sink.data_bytes} bytes)")
+                self._send_success_response(stream_id, state, files=sink.reader.entries)
 
-                src = cmd.get("src", "")
+            elif command == "stripe_begin":
                 dest = cmd.get("dest", "")
-                command = cmd.get("command", "copy")
+                size = cmd.get("size")
+                transfer_id = cmd.get("transfer_id")
+                if not dest or not transfer_id or not isinstance(size, int) or size < 0:
+                    print(f"[!] stripe_begin requires 'dest', 'transfer_id' and 'size'")
+                    self._send_error_response(stream_id, "stripe_begin requires 'dest', 'transfer_id' and 'size'")
+                    return
 
-                print(f"[DEBUG] Command: {command}, src: {src}, dest: {dest}")
+                target_path = _safe_path(dest)
 
-                try:
-                    if command == "copy" or command == "move":
-                        if not dest:
-                            print(f"[!] {command} requires 'dest' path")
-                            return
-                        
-                        target_path = _safe_path(dest)
-                        
-                        # Create parent directory if needed
-                        parent_dir = os.path.dirname(target_path)
-                        if parent_dir:
-                            os.makedirs(parent_dir, exist_ok=True)
-                        
-                        # Write the file
-                        with open(target_path, "wb") as f:
-                            f.write(filedata)
-                        print(f"[+] {command.capitalize()}d to {target_path} ({len(filedata)} bytes)")
-
-                    elif command == "fetch":
-                        # NEW: Handle fetch command - send file back to requester
-                        if not src:
-                            print(f"[!] Fetch requires 'src' path")
-                            self._send_error_response(stream_id, "src path required")
-                            return
-                        
-                        source_path = _safe_path(src)
-                        
-                        if not os.path.exists(source_path):
-                            print(f"[!] File not found: {source_path}")
-                            self._send_error_response(stream_id, f"File not found: {source_path}")
-                            return
-                        
-                        if not os.path.isfile(source_path):
-                            print(f"[!] Not a file: {source_path}")
-                            self._send_error_response(stream_id, f"Not a file: {source_path}")
-                            return
-                        
-                        # Read the file
-                        try:
-                            with open(source_path, "rb") as f:
-                                file_content = f.read()
-                            
-                            # Send file back
-                            response_stream_id = self._quic.get_next_available_stream_id()
-                            
-                            # Send response header
-                            response_header = json.dumps({
-                                "status": "success",
-                                "src": src,
-                                "size": len(file_content)
-                            }).encode()
-                            
-                            self._quic.send_stream_data(response_stream_id, response_header + b"\n", end_stream=False)
-                            self.transmit()
-                            
-                            # Send file data in chunks
-                            CHUNK_SIZE = 64 * 1024
-                            offset = 0
-                            while offset < len(file_content):
-                                chunk = file_content[offset:offset + CHUNK_SIZE]
-                                is_last = (offset + len(chunk)) >= len(file_content)
-                                self._quic.send_stream_data(response_stream_id, chunk, end_stream=is_last)
-                                self.transmit()
-                                offset += len(chunk)
-                            
-                            print(f"[+] Sent file {source_path} ({len(file_content)} bytes)")
-                            
-                        except PermissionError:
-                            print(f"[!] Permission denied: {source_path}")
-                            self._send_error_response(stream_id, f"Permission denied: {source_path}")
-                        except Exception as e:
-                            print(f"[!] Error reading file: {e}")
-                            self._send_error_response(stream_id, f"Error reading file: {str(e)}")
-
-                    elif command == "create":
-                        if not src:
-                            print(f"[!] Create requires 'src' path")
-                            return
-                        
-                        target_path = _safe_path(src)
-                        parent_dir = os.path.dirname(target_path)
-                        if parent_dir:
-                            os.makedirs(parent_dir, exist_ok=True)
-                        open(target_path, "w").close()
-                        print(f"[+] Created {target_path}")
-
-                    elif command == "delete":
-                        if not src:
-                            print(f"[!] Delete requires 'src' path")
-                            return
-                        
-                        target_path = _safe_path(src)
-                        
-                        if os.path.exists(target_path):
-                            os.remove(target_path)
-                            print(f"[+] Deleted {target_path}")
-                        else:
-                            print(f"[!] File not found: {target_path}")
+                # Reuse the live transfer, or resume one checkpointed on disk
+                striped = _striped_transfers.get(transfer_id)
+                if striped is None or striped.size != size or striped.target_path != target_path:
+                    if striped is not None:
+                        del _striped_transfers[transfer_id]
+                        disk_io.submit(striped.part_path, striped.abort).add_done_callback(_log_io_error)
+                    opened = await disk_io.submit(target_path + ".part", _open_striped, transfer_id, target_path, size)
+                    striped = _striped_transfers.setdefault(transfer_id, opened)
+                    if striped is not opened:
+                        # A concurrent stripe_begin for the same transfer won
+                        disk_io.submit(opened.part_path, opened.suspend).add_done_callback(_log_io_error)
+                    _start_stripe_reaper()
 
-                    else:
-                        print(f"[!] Unknown command: {command}")
+                if cmd.get("manifest") is not None:
+                    try:
+                        _use_manifest(striped, cmd["manifest"])
+                    except ValueError as e:
+                        print(f"[!] Invalid manifest for {transfer_id}: {e}")
+                        self._send_error_response(stream_id, f"Invalid manifest: {e}")
+                        return
+                if striped.ranges:
+                    print(f"[+] Resuming transfer {transfer_id} to {target_path} ({striped.received}/{size} bytes present)")
+                else:
+                    print(f"[+] Striped transfer {transfer_id} to {target_path} ({size} bytes) started")
+                self._send_response(stream_id, {
+                    "status": "success",
+                    "command": "stripe_begin",
+                    "bytes": striped.received,
+                    "ranges": striped.ranges
+                })
 
-                except ValueError as ve:
-                    print(f"[!] Path error: {ve}")
-                except Exception as e:
-                    print(f"[!] Operation error: {e}")
-    
-    def _send_error_response(self, stream_id, error_msg):
-        """Send error response back to client"""
+            elif command == "range":
+                if state.bytes_written != cmd.get("size"):
+                    self._fail(stream_id, state, f"Range incomplete: {state.bytes_written} of {cmd.get('size')} bytes")
+                    return
+                await disk_io.submit(state.io_key, state.sink.close)
+                if state.failed:
+                    return
+                state.sink = None
+                self._send_success_response(stream_id, state)
+
+            elif command == "stripe_commit":
+                transfer_id = cmd.get("transfer_id")
+                striped = _striped_transfers.get(transfer_id)
+                if striped is None:
+                    print(f"[!] Unknown striped transfer: {transfer_id}")
+                    self._send_error_response(stream_id, f"Unknown striped transfer: {transfer_id}")
+                    return
+
+                missing = striped.missing()
+                if missing:
+                    print(f"[!] Striped transfer {transfer_id} incomplete: {len(missing)} range(s) missing")
+                    self._send_response(stream_id, {
+                        "status": "error",
+                        "error": f"{len(missing)} range(s) missing",
+                        "missing": missing,
+                        "retryable": True
+                    })
+                    return
+
+                manifest = None
+                if cmd.get("manifest") is not None:
+                    try:
+                        manifest = Manifest.from_header(cmd["manifest"], striped.size)
+                    except ValueError as e:
+                        print(f"[!] Invalid manifest for {transfer_id}: {e}")
+                        self._send_error_response(stream_id, f"Invalid manifest: {e}")
+                        return
+                    bad = await disk_io.submit(striped.part_path, striped.verify, manifest)
+                    if _striped_transfers.get(transfer_id) is not striped:
+                        self._send_error_response(stream_id, f"Striped transfer {transfer_id} ended during verification")
+                        return
+                    if bad:
+                        print(f"[!] Striped transfer {transfer_id}: {len(bad)} corrupt chunk(s), asking for them again")
+                        self._send_response(stream_id, {
+                            "status": "error",
+                            "error": f"{len(bad)} corrupt chunk(s)",
+                            "missing": striped.missing(),
+                            "retryable": True
+                        })
+                        return
+
+                del _striped_transfers[transfer_id]
+                await disk_io.submit(striped.part_path, striped.commit, _file_metadata(cmd))
+                state.bytes_written = striped.size
+                print(f"[+] Striped transfer committed to {striped.target_path} ({striped.size} bytes)")
+                if manifest is not None:
+                    self._send_success_response(stream_id, state, manifest_root=manifest.root.hex())
+                else:
+                    self._send_success_response(stream_id, state)
+
+            elif command == "fetch":
+                # NEW: Handle fetch command - send file back to requester
+                if not src:
+                    print(f"[!] Fetch requires 'src' path")
+                    self._send_error_response(stream_id, "src path required")
+                    return
+                
+                source_path = _safe_path(src)
+                
+                # Stream the file back; reads wait for send credit
+                codec = choose_codec(cmd.get("accept_compression") or [])
+                await self._send_file(stream_id, src, source_path, codec)
+
+            elif command == "create":
+                if not src:
+                    print(f"[!] Create requires 'src' path")
+                    self._send_error_response(stream_id, "src path required")
+                    return
+                
+                target_path = _safe_path(src)
+                await disk_io.submit(target_path, _create_file, target_path, interactive=True)
+                print(f"[+] Created {target_path}")
+                self._send_success_response(stream_id, state)
+
+            elif command == "mkdir":
+                dirs = cmd.get("dirs") or []
+                if not cmd.get("dest") or not isinstance(dirs, list):
+                    print(f"[!] mkdir requires 'dest' and a list of relative 'dirs'")
+                    self._send_error_response(stream_id, "mkdir requires 'dest' and a list of relative 'dirs'")
+                    return
+
+                target_path = _safe_path(cmd["dest"])
+                paths = [_relative_path(target_path, relative) for relative in dirs]
+                created = await disk_io.submit(target_path, _make_dirs, target_path, paths, interactive=True)
+                print(f"[+] Created {created} of {len(dirs) + 1} directories under {target_path}")
+                self._send_response(stream_id, {
+                    "status": "success",
+                    "command": command,
+                    "created": created
+                })
+
+            elif command == "delete":
+                if not src:
+                    print(f"[!] Delete requires 'src' path")
+                    self._send_error_response(stream_id, "src path required")
+                    return
+                
+                target_path = _safe_path(src)
+                
+                if await disk_io.submit(target_path, _delete_file, target_path, interactive=True):
+                    print(f"[+] Deleted {target_path}")
+                    self._send_success_response(stream_id, state)
+                else:
+                    print(f"[!] File not found: {target_path}")
+                    self._send_error_response(stream_id, f"File not found: {target_path}")
+
+            else:
+                print(f"[!] Unknown command: {command}")
+                self._send_error_response(stream_id, f"Unknown command: {command}")
+
+        except ValueError as ve:
+            if not state.failed:
+                self._fail(stream_id, state, f"Path error: {ve}")
+        except Exception as e:
+            if not state.failed:
+                self._fail(stream_id, state, f"Operation error: {e}")
+        finally:
+            self._release_writer(state)
+
+    async def _send_file(self, stream_id, src, source_path, codec=None):
+        """
+        Send a file back on the request stream, reading each chunk from
+        disk only once the stream and connection have credit for it.
+        With a codec, each chunk is sent as a compression block. Small
+        files are sent with priority over bulk transfers.
+        """
+        try:
+            f, file_size = await disk_io.submit(source_path, _open_for_read, source_path, interactive=True)
+        except (FileNotFoundError, IsADirectoryError) as e:
+            print(f"[!] {e}")
+            self._send_error_response(stream_id, str(e))
+            return
+        except PermissionError:
+            print(f"[!] Permission denied: {source_path}")
+            self._send_error_response(stream_id, f"Permission denied: {source_path}")
+            return
+        except Exception as e:
+            print(f"[!] Error reading file: {e}")
+            self._send_error_response(stream_id, f"Error reading file: {str(e)}")
+            return
+
+        small = file_size <= SMALL_FETCH
+        if small:
+            self.prioritize(stream_id)
+        header_sent = False
         try:
-            response_stream_id = self._quic.get_next_available_stream_id()
-            error_header = json.dumps({
-                "status": "error",
-                "error": error_msg
-            }).encode()
-            self._quic.send_stream_data(response_stream_id, error_header + b"\n", end_stream=True)
+            with f:
+                # Send response header
+                response_header = {
+                    "status": "success",
+                    "src": src,
+                    "size": file_size
+                }
+                if codec:
+                    response_header["compression"] = codec
+                compressor = ChunkCompressor(codec) if codec else None
+
+                self._quic.send_stream_data(stream_id, json.dumps(response_header).encode() + b"\n",
+                                            end_stream=file_size == 0)
+                self.transmit()
+                header_sent = True
+
+                # Send file data as credit allows
+                sent = 0
+                wire_bytes = 0
+                while sent < file_size:
+                    wanted = min(CHUNK_SIZE, file_size - sent)
+                    credit = await self.wait_writable(stream_id, wanted)
+                    # Blocks are read whole; they may overshoot the credit by a block
+                    chunk = await disk_io.submit(source_path, f.read, wanted if compressor else min(credit, wanted),
+                                                 interactive=small)
+                    if not chunk:
+                        raise IOError(f"File truncated at {sent} of {file_size} bytes")
+                    sent += len(chunk)
+                    if compressor:
+                        chunk = compressor.pack(chunk)
+                    wire_bytes += len(chunk)
+                    self._quic.send_stream_data(stream_id, chunk, end_stream=sent >= file_size)
+                    self.transmit()
+
+            if codec:
+                print(f"[+] Sent file {source_path} ({file_size} bytes, {wire_bytes} on the wire with {codec})")
+            else:
+                print(f"[+] Sent file {source_path} ({file_size} bytes)")
+
+        except ConnectionError as e:
+            print(f"[!] Fetch of {source_path} aborted: {e}")
+        except Exception as e:
+            print(f"[!] Error reading file: {e}")
+            if not header_sent:
+                self._send_error_response(stream_id, f"Error reading file: {str(e)}")
+            else:
+                self._quic.reset_stream(stream_id, error_code=STOP_ERROR_CODE)
+                self.transmit()
+
+    def _send_response(self, stream_id, response):
+        """Send the response line on the request stream and close our side"""
+        try:
+            self._quic.send_stream_data(stream_id, json.dumps(response).encode() + b"\n", end_stream=True)
             self.transmit()
         except Exception as e:
-            print(f"[!] Failed to send error response: {e}")
+            print(f"[!] Failed to send response: {e}")
 
+    def _send_success_response(self, stream_id, state, **fields):
+        """Report a completed command with its byte count, duration and checksum"""
+        response = {
+            "status": "success",
+            "command": state.cmd.get("command", "copy"),
+            "bytes": state.bytes_written,
+            "elapsed": round(time.monotonic() - state.started, 6),
+            "checksum": f"crc32:{state.checksum:08x}"
+        }
+        if state.hasher is not None:
+            response["digest"] = f"{state.cmd['digest']}:{state.hasher.digest().hex()}"
+        response.update(fields)
+        self._send_response(stream_id, response)
 
-async def main(host, port, cert, key):
+    def _send_error_response(self, stream_id, error_msg):
+        """Send error response back to client"""
+        self._send_response(stream_id, {
+            "status": "error",
+            "error": error_msg
+        })
+
+
+def _print_banner(host, port, cert, workers):
     print(f"╔═══════════════════════════════════════════════════════╗")
     print(f"║          QUIC File Transfer Server Starting          ║")
     print(f"╚═══════════════════════════════════════════════════════╝")
     print(f"  Host: {host}")
     print(f"  Port: {port}")
     print(f"  Certificate: {cert}")
-    print(f"  Supported commands: copy, move, create, delete, fetch")
+    print(f"  Workers: {workers}")
+    print(f"  UDP fast path: {'on' if udpio.fastpath_enabled() else 'off'}")
+    print(f"  Transport profile: {active_profile()}")
+    print(f"  Memory budget: {memory_budget.limit >> 20} MB per worker")
+    print(f"  Supported commands: copy, move, create, delete, fetch, stripe_begin, range, stripe_commit, signature, delta, mkdir, pack, hello, status")
+    print(f"  Compression: {', '.join(available_codecs())}")
     print(f"  Listening for file operations...")
     print()
-    
-    configuration = QuicConfiguration(is_client=False)
+
+
+def _server_configuration(cert, key):
+    configuration = quic_configuration(is_client=False)
     configuration.load_cert_chain(cert, key)
+    return configuration
 
-    await serve(
+
+async def main(host, port, cert, key):
+    _print_banner(host, port, cert, 1)
+
+    # UDP_FASTPATH batches datagrams with GSO/GRO (see udpio.py)
+    await (udpio.serve if udpio.fastpath_enabled() else serve)(
         host,
         port,
-        configuration=configuration,
+        configuration=_server_configuration(cert, key),
         create_protocol=FileReceiverProtocol,
+        session_ticket_fetcher=session_tickets.pop,
+        session_ticket_handler=session_tickets.add,
     )
     await asyncio.Future()
 
 
+async def _serve_worker(index, sock, cert, key):
+    configuration = _server_configuration(cert, key)
+    def create_server():
+        return QuicServer(
+            configuration=configuration,
+            create_protocol=partial(FileReceiverProtocol, worker_index=index),
+            session_ticket_fetcher=session_tickets.pop,
+            session_ticket_handler=session_tickets.add,
+        )
+
+    if udpio.fastpath_enabled():
+        await udpio.create_endpoint(create_server, sock)
+    else:
+        await asyncio.get_running_loop().create_datagram_endpoint(create_server, sock=sock)
+    await asyncio.Future()
+
+
+def _worker_main(index, sock, cert, key):
+    try:
+        asyncio.run(_serve_worker(index, sock, cert, key))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(host, port, cert, key, workers):
+    """
+    Serve from `workers` processes sharing the port with SO_REUSEPORT and
+    restart any that exit. The sockets are created and kept here, so a
+    restarted worker takes over the same socket (and its queued datagrams)
+    and keeps its index in the reuseport group.
+    """
+    if not 1 <= workers <= 255:
+        raise ValueError("--workers must be between 1 and 255")
+    _print_banner(host, port, cert, workers)
+    sockets, steered = reuseport_sockets(host, port, workers)
+    print(f"[+] Steering packets by {'connection ID' if steered else 'address hash'}")
+
+    context = multiprocessing.get_context("fork")
+    processes = {}
+    started = {}
+    restart_at = {}
+
+    def start(index):
+        process = context.Process(
+            target=_worker_main,
+            args=(index, sockets[index], cert, key),
+            name=f"quic-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        processes[index] = process
+        started[index] = time.monotonic()
+        print(f"[+] Worker {index} started (pid {process.pid})")
+
+    try:
+        for index in range(workers):
+            start(index)
+
+        while True:
+            timeout = None
+            if restart_at:
+                timeout = max(0, min(restart_at.values()) - time.monotonic())
+            sentinels = {process.sentinel: index for index, process in processes.items()}
+            for sentinel in multiprocessing.connection.wait(list(sentinels), timeout):
+                index = sentinels[sentinel]
+                process = processes.pop(index)
+                process.join()
+                print(f"[!] Worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                restart_at[index] = started[index] + WORKER_RESTART_DELAY
+
+            now = time.monotonic()
+            for index, due in list(restart_at.items()):
+                if due <= now:
+                    del restart_at[index]
+                    start(index)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+        for sock in sockets:
+            sock.close()
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QUIC file transfer server")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Server processes sharing the port (SO_REUSEPORT, Linux)")
+    args = parser.parse_args()
+
     try:
         env = load_env_vars()
+        # Sized at import, before .env was loaded; workers inherit the limit when forked
+        memory_budget.limit = memory_budget_bytes()
         
         host = env["host"]
         port = int(env["port"])
         cert = env["certi"]
         key = env["key"]
         
-        asyncio.run(main(host, port, cert, key))
+        if args.workers > 1:
+            run_workers(host, port, cert, key, args.workers)
+        else:
+            asyncio.run(main(host, port, cert, key))
     except KeyboardInterrupt:
         print("\n\n[!] Server stopped by user")
     except KeyError as e:
         print(f"[!] Missing required environment variable: {e}")
     except Exception as e:
-        print(f"[!] Error starting server: {e}")
\ No newline at end of file
+        print(f"[!] Error starting server: {e}")
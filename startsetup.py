@@ -192,6 +192,13 @@ def load_env_vars():
     certi = os.getenv("CERTI", "")
     key = os.getenv("KEY", "")
     dest_host = os.getenv("DEST_HOST", "")
+    udp_fastpath = os.getenv("UDP_FASTPATH", "").lower() in ("1", "true", "yes", "on")
+    quic_profile = os.getenv("QUIC_PROFILE", "") or "default"
+    integrity_mismatch = os.getenv("INTEGRITY_MISMATCH", "") or "reject"
+    hash_cache = os.getenv("HASH_CACHE", "")
+    durability = os.getenv("DURABILITY", "") or "none"
+    memory_budget_mb = os.getenv("MEMORY_BUDGET_MB", "")
+    pack_threshold_kb = os.getenv("PACK_THRESHOLD_KB", "")
     
     print(f"[+] Loaded environment variables from .env")
     # print({
@@ -226,7 +233,14 @@ def load_env_vars():
         "gateway": gateway,
         "broadcast": broadcast_address,
         "cidr": cidr,
-        "dest_host": dest_host
+        "dest_host": dest_host,
+        "udp_fastpath": udp_fastpath,
+        "quic_profile": quic_profile,
+        "integrity_mismatch": integrity_mismatch,
+        "hash_cache": hash_cache,
+        "durability": durability,
+        "memory_budget_mb": memory_budget_mb,
+        "pack_threshold_kb": pack_threshold_kb
     }
 
 
@@ -0,0 +1,59 @@
+"""
+Shared fixtures: a self-signed certificate and a QUIC server running in
+this process on a background thread, so tests can inspect its state.
+"""
+import asyncio
+import datetime
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def certificate(tmp_path_factory):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    directory = tmp_path_factory.mktemp("cert")
+    cert_path, key_path = directory / "cert.pem", directory / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    return str(cert_path), str(key_path)
+
+
+@pytest.fixture(scope="session")
+def quic_server(certificate):
+    """(host, port) of a server running in this process"""
+    import server
+    from aioquic.asyncio import serve
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    started = threading.Event()
+
+    async def run():
+        await serve("127.0.0.1", port, configuration=server._server_configuration(*certificate),
+                    create_protocol=server.FileReceiverProtocol)
+        started.set()
+        await asyncio.Future()
+
+    threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+    assert started.wait(10)
+    return "127.0.0.1", port
@@ -0,0 +1,25 @@
+import asyncio
+import os
+
+import client
+import server
+from connection_pool import run_quic
+
+
+def test_tiny_budget_does_not_stall_concurrent_streams(quic_server, tmp_path, monkeypatch):
+    # Each stream is left holding a partial batch when credit runs out;
+    # the server must write those out for the budget to recover
+    host, port = quic_server
+    monkeypatch.setattr(server.memory_budget, "limit", 1024 * 1024)
+    data = os.urandom(5 * 1000 * 1000)
+
+    async def copy_all():
+        return await asyncio.gather(*(
+            client.send_quic_command(host, port, None, "copy", dest=str(tmp_path / f"f{i}"), filedata=data)
+            for i in range(8)))
+
+    results = run_quic(copy_all(), timeout=120)
+    assert all(result["status"] == "success" for result in results)
+    assert all((tmp_path / f"f{i}").read_bytes() == data for i in range(8))
+    assert server.memory_budget.used == 0
+    assert not server.memory_budget.exhausted
@@ -0,0 +1,37 @@
+import struct
+
+import pytest
+
+import compression
+from compression import BLOCK_HEADER, COMPRESSED, BlockDecoder
+
+
+def _block(payload, size):
+    return BLOCK_HEADER.pack(COMPRESSED, len(payload), size) + payload
+
+
+def test_zstd_frame_declaring_a_huge_size_is_rejected():
+    zstandard = pytest.importorskip("zstandard")
+    if "zstd" not in compression.CODECS:
+        pytest.skip("zstd codec not registered")
+    # Single-segment frame with an 8-byte content size of 1TB and one empty raw block
+    forged = struct.pack("<IB", 0xFD2FB528, 0xE0) + struct.pack("<Q", 1 << 40) + b"\x01\x00\x00"
+    assert zstandard.frame_content_size(forged) == 1 << 40
+    with pytest.raises(ValueError):
+        BlockDecoder("zstd").feed(_block(forged, 1024))
+
+
+def test_lz4_block_larger_than_declared_is_rejected():
+    lz4_frame = pytest.importorskip("lz4.frame")
+    if "lz4" not in compression.CODECS:
+        pytest.skip("lz4 codec not registered")
+    payload = lz4_frame.compress(b"\0" * (64 * 1024 * 1024))
+    with pytest.raises(ValueError):
+        BlockDecoder("lz4").feed(_block(payload, 1024))
+
+
+def test_matching_blocks_decode():
+    data = b"abc" * 10000
+    for codec in compression.available_codecs():
+        encoded = compression.ChunkCompressor(codec).pack(data)
+        assert b"".join(BlockDecoder(codec).feed(encoded)) == data
@@ -0,0 +1,10 @@
+import hashcache
+
+
+def test_unavailable_cache_is_not_retried(monkeypatch, capsys):
+    monkeypatch.setenv("HASH_CACHE", "/proc/version")
+    monkeypatch.setattr(hashcache, "_cache", None)
+    monkeypatch.setattr(hashcache, "_cache_failed", None)
+    assert hashcache.default_cache() is None
+    assert hashcache.default_cache() is None
+    assert capsys.readouterr().out.count("unavailable") == 1
@@ -0,0 +1,70 @@
+"""
+Directory walking for recursive transfers.
+
+walk_tree() is a depth-first os.scandir() walk that keeps one directory
+iterator open per level, so memory grows with the depth of the tree, not
+with the number of entries. Paths are yielded relative to the root with
+"/" separators, which is what the server expects whatever the sender's OS.
+
+mkdir_batches() groups directories into lists small enough for the
+"dirs" field of one mkdir command header.
+"""
+import json
+import os
+
+MKDIR_BATCH_BYTES = 48 * 1024  # JSON bytes of paths per mkdir command (header fields are limited to 64KB)
+WALK_BATCH = 256  # Entries handed from the walking thread to the event loop at a time
+
+
+def walk_tree(root, dirs_only=False, on_error=None):
+    """
+    Yield (relative path, is_dir, size) for every directory and regular
+    file below root, parents before their contents (size is 0 for
+    directories). Symlinks to directories are
+    not followed. Entries that cannot be read are passed to
+    on_error(relative path, exception) and skipped.
+    """
+    stack = [("", os.scandir(root))]
+    try:
+        while stack:
+            prefix, entries = stack[-1]
+            try:
+                entry = next(entries, None)
+            except OSError as e:
+                entry = None
+                if on_error is not None:
+                    on_error(prefix or ".", e)
+            if entry is None:
+                entries.close()
+                stack.pop()
+                continue
+
+            path = prefix + "/" + entry.name if prefix else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    yield path, True, 0
+                    stack.append((path, os.scandir(entry.path)))
+                elif not dirs_only and entry.is_file():
+                    yield path, False, entry.stat().st_size
+            except OSError as e:
+                if on_error is not None:
+                    on_error(path, e)
+    finally:
+        for _, entries in stack:
+            entries.close()
+
+
+def mkdir_batches(paths, limit=MKDIR_BATCH_BYTES):
+    """Group relative directory paths into lists of at most limit bytes of JSON"""
+    batch = []
+    size = 0
+    for path in paths:
+        length = len(json.dumps(path)) + 2  # Plus the comma and space in the JSON list
+        if batch and size + length > limit:
+            yield batch
+            batch = []
+            size = 0
+        batch.append(path)
+        size += length
+    if batch:
+        yield batch
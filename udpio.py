@@ -0,0 +1,266 @@
+"""
+Batched UDP I/O for QUIC connections (Linux).
+
+asyncio's datagram transport makes one sendto() per QUIC packet and one
+recvfrom() per datagram. BatchedDatagramTransport instead:
+
+- collects the packets queued during one event loop iteration and sends
+  runs of equal-sized packets to the same address as a single UDP GSO
+  (UDP_SEGMENT) sendmsg(), which the kernel or NIC splits into datagrams;
+- enables UDP GRO, so one recvmsg() can return several coalesced datagrams
+  that are split again using the segment size the kernel reports, and
+  reads up to RECV_BATCH times per wakeup;
+- enlarges the socket buffers to UDP_BUFFER_SIZE.
+
+Python has no sendmmsg()/recvmmsg(), so GSO/GRO is what does the batching.
+Set UDP_FASTPATH=1 in .env to use it; serve()/connect() fall back to the
+stock asyncio transport when the kernel lacks UDP GSO.
+"""
+import asyncio
+import collections
+import errno
+import itertools
+import os
+import socket
+import struct
+import sys
+from contextlib import asynccontextmanager
+from aioquic.asyncio.server import QuicServer
+from aioquic.quic.connection import QuicConnection
+
+UDP_SEGMENT = 103  # Linux socket options, not exported by the socket module
+UDP_GRO = 104
+
+UDP_BUFFER_SIZE = 8 * 1024 * 1024  # Requested SO_SNDBUF/SO_RCVBUF (capped by net.core.[rw]mem_max)
+GSO_MAX_SEGMENTS = 64  # Kernel limit on datagrams per GSO send
+GSO_MAX_BYTES = 65000  # Stay under the 64KB UDP payload limit
+RECV_SIZE = 65535  # Large enough for a fully coalesced GRO read
+RECV_BATCH = 64  # Max reads per readiness callback before yielding to the loop
+
+
+def fastpath_enabled():
+    """Whether UDP_FASTPATH is set (see load_env_vars)"""
+    return os.getenv("UDP_FASTPATH", "").lower() in ("1", "true", "yes", "on")
+
+
+def tune_buffers(sock, size=UDP_BUFFER_SIZE):
+    """Ask for larger socket buffers; the kernel may grant less"""
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, size)
+        except OSError:
+            pass
+
+
+def probe(sock):
+    """Return (gso, gro): which offloads the kernel supports for sock"""
+    if not sys.platform.startswith("linux"):
+        return False, False
+    try:
+        sock.getsockopt(socket.SOL_UDP, UDP_SEGMENT)
+        gso = True
+    except OSError:
+        gso = False
+    try:
+        sock.setsockopt(socket.SOL_UDP, UDP_GRO, 1)
+        gro = True
+    except OSError:
+        gro = False
+    return gso, gro
+
+
+class BatchedDatagramTransport(asyncio.DatagramTransport):
+    """Datagram transport doing GSO sends and GRO receives on a bound socket"""
+    def __init__(self, loop, sock, protocol, gro):
+        super().__init__()
+        self._loop = loop
+        self._sock = sock
+        self._fd = sock.fileno()
+        self._protocol = protocol
+        self._gso = True
+        self._ancillary_size = socket.CMSG_SPACE(4) if gro else 0
+        self._recv_buffer = bytearray(RECV_SIZE)
+        self._pending = collections.deque()
+        self._pending_bytes = 0
+        self._flush_scheduled = False
+        self._writer_added = False
+        self._closing = False
+        self._extra = {"socket": sock, "sockname": sock.getsockname()}
+
+        sock.setblocking(False)
+        loop.add_reader(self._fd, self._read_ready)
+
+    def get_extra_info(self, name, default=None):
+        return self._extra.get(name, default)
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._fd)
+        if self._writer_added:
+            self._loop.remove_writer(self._fd)
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._loop.call_soon(self._connection_lost)
+
+    def abort(self):
+        self.close()
+
+    def get_write_buffer_size(self):
+        return self._pending_bytes
+
+    def sendto(self, data, addr=None):
+        if self._closing:
+            return
+        self._pending.append((data, addr))
+        self._pending_bytes += len(data)
+        if not self._flush_scheduled and not self._writer_added:
+            # Everything queued before the next loop iteration goes out together
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+    def _connection_lost(self):
+        try:
+            self._protocol.connection_lost(None)
+        finally:
+            self._sock.close()
+
+    def _next_batch(self):
+        """Leading packets that can share one GSO send: same address, equal size, shorter last"""
+        first, addr = self._pending[0]
+        if not self._gso:
+            return [first], addr
+        segment = len(first)
+        limit = min(GSO_MAX_SEGMENTS, max(1, GSO_MAX_BYTES // segment))
+        batch = [first]
+        for data, other in itertools.islice(self._pending, 1, limit):
+            if other != addr or len(data) > segment:
+                break
+            batch.append(data)
+            if len(data) < segment:
+                break
+        return batch, addr
+
+    def _flush(self):
+        self._flush_scheduled = False
+        while self._pending and not self._closing:
+            batch, addr = self._next_batch()
+            try:
+                if len(batch) > 1:
+                    control = [(socket.SOL_UDP, UDP_SEGMENT, struct.pack("=H", len(batch[0])))]
+                    self._sock.sendmsg([b"".join(batch)], control, 0, addr)
+                else:
+                    self._sock.sendto(batch[0], addr)
+            except (BlockingIOError, InterruptedError):
+                if not self._writer_added:
+                    self._loop.add_writer(self._fd, self._flush)
+                    self._writer_added = True
+                return
+            except OSError as e:
+                if len(batch) > 1 and e.errno in (errno.EIO, errno.EINVAL, errno.EOPNOTSUPP):
+                    # The route cannot segment (e.g. no checksum offload)
+                    print(f"[!] UDP GSO failed ({e}), sending datagrams individually")
+                    self._gso = False
+                    continue
+                self._protocol.error_received(e)
+
+            for _ in batch:
+                data, _ = self._pending.popleft()
+                self._pending_bytes -= len(data)
+
+        if self._writer_added:
+            self._loop.remove_writer(self._fd)
+            self._writer_added = False
+
+    def _read_ready(self):
+        view = memoryview(self._recv_buffer)
+        for _ in range(RECV_BATCH):
+            if self._closing:
+                return
+            try:
+                size, ancillary, _, addr = self._sock.recvmsg_into([self._recv_buffer], self._ancillary_size)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self._protocol.error_received(e)
+                return
+
+            if not size:
+                continue
+            segment = size
+            for level, kind, value in ancillary:
+                if level == socket.SOL_UDP and kind == UDP_GRO:
+                    segment = struct.unpack("=i", value[:4])[0] or size
+            for start in range(0, size, segment):
+                self._protocol.datagram_received(bytes(view[start:min(start + segment, size)]), addr)
+
+
+async def create_endpoint(protocol_factory, sock):
+    """
+    Like loop.create_datagram_endpoint(protocol_factory, sock=sock), using
+    BatchedDatagramTransport when the kernel supports UDP GSO.
+    """
+    loop = asyncio.get_running_loop()
+    tune_buffers(sock)
+    gso, gro = probe(sock)
+    if not gso:
+        print("[!] UDP GSO not supported, using the standard datagram transport")
+        return await loop.create_datagram_endpoint(protocol_factory, sock=sock)
+
+    protocol = protocol_factory()
+    transport = BatchedDatagramTransport(loop, sock, protocol, gro)
+    protocol.connection_made(transport)
+    return transport, protocol
+
+
+async def serve(host, port, *, configuration, create_protocol, **server_options):
+    """aioquic.asyncio.serve() on the batched transport (server_options go to QuicServer)"""
+    family, _, _, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.bind(address)
+    except OSError:
+        sock.close()
+        raise
+    _, protocol = await create_endpoint(
+        lambda: QuicServer(configuration=configuration, create_protocol=create_protocol, **server_options), sock)
+    return protocol
+
+
+@asynccontextmanager
+async def connect(host, port, *, configuration, create_protocol, session_ticket_handler=None,
+                  wait_connected=True):
+    """aioquic.asyncio.connect() on the batched transport"""
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(host, port, type=socket.SOCK_DGRAM)
+    addr = infos[0][4]
+    if len(addr) == 2:
+        addr = ("::ffff:" + addr[0], addr[1], 0, 0)
+
+    if configuration.server_name is None:
+        configuration.server_name = host
+    connection = QuicConnection(configuration=configuration, session_ticket_handler=session_ticket_handler)
+
+    # Dual stack, as aioquic's connect() does
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+        sock.bind(("::", 0, 0, 0))
+    except OSError:
+        sock.close()
+        raise
+
+    transport, protocol = await create_endpoint(lambda: create_protocol(connection), sock)
+    try:
+        protocol.connect(addr, transmit=wait_connected)
+        if wait_connected:
+            await protocol.wait_connected()
+        yield protocol
+    finally:
+        protocol.close()
+        await protocol.wait_closed()
+        transport.close()